@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Scale benchmark of discovery and rollout against a simulated fleet, results are appended per git commit
+
+    python benchmark/run.py --devices 10 100 1000 --latency 5 --bandwidth 10 --failure-rate 0.01
+    python benchmark/run.py --compare
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from simulator import SimulatedFleet, create_package
+from pool import connection_pool
+from metrics import operate_metrics
+from payload import SharedPackage
+from scheduler import OperateScheduler
+from operate import LocalUpdate, Reboot
+from scanner import FleetScanner, describe_device
+
+APP_NAME = 'bench'
+EXE_NAME = 'bench.bin'
+RESULTS = os.path.join(ROOT, 'benchmark', 'results.jsonl')
+
+
+class ResourceSampler(object):
+    def __init__(self, interval: float = 0.05):
+        """Sample peak thread count in background, peak rss comes from getrusage"""
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.peak_threads = threading.active_count()
+        self._thread = threading.Thread(target=self.threadSample, name='ResourceSampler')
+        self._thread.setDaemon(True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+    def threadSample(self):
+        while not self._stopped.wait(self._interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    @staticmethod
+    def peak_rss() -> int:
+        # Linux ru_maxrss is in KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def wait_all(count: int, timeout: float) -> Tuple[Callable, Callable[[], int]]:
+    """Return operate callback and waiter, waiter returns failed count"""
+    lock = threading.Lock()
+    done = threading.Event()
+    state = dict(remaining=count, failed=0)
+
+    def callback(result, *_args):
+        with lock:
+            state['remaining'] -= 1
+            state['failed'] += isinstance(result, str) or result is False
+            if state['remaining'] <= 0:
+                done.set()
+
+    def wait() -> int:
+        if count and not done.wait(timeout):
+            raise TimeoutError(f'{state["remaining"]}/{count} operates not finished in {timeout}s')
+
+        return state['failed']
+
+    return callback, wait
+
+
+def bench_scan(fleet: SimulatedFleet, concurrency: int, timeout: float) -> Dict[str, float]:
+    finished = threading.Event()
+    statistics = list()
+
+    async def probe(address: str, run):
+        device, _ = await describe_device(address, APP_NAME, run)
+        return device
+
+    scanner = FleetScanner(probe, lambda device: None, finished=lambda x: (statistics.append(x), finished.set()),
+                           concurrency=concurrency, scan_timeout=timeout)
+    scanner.scan(fleet.addresses)
+    finished.wait()
+    return dict(scan_time=statistics[0].elapsed, scan_found=statistics[0].found, scan_failed=statistics[0].failed)
+
+
+def bench_update(fleet: SimulatedFleet, package: SharedPackage, timeout: float) -> Dict[str, float]:
+    scheduler = OperateScheduler()
+    args = [(row, address, APP_NAME, package, "", "") for row, address in enumerate(fleet.addresses)]
+    callback, wait = wait_all(len(args), timeout)
+
+    start = time.perf_counter()
+    scheduler.submit(LocalUpdate(None, callback), args)
+    failed = wait()
+    return dict(update_time=time.perf_counter() - start, update_failed=failed)
+
+
+def bench_reboot(fleet: SimulatedFleet, timeout: float) -> Dict[str, float]:
+    scheduler = OperateScheduler()
+    args = [(row, address) for row, address in enumerate(fleet.addresses)]
+    callback, wait = wait_all(len(args), timeout)
+
+    start = time.perf_counter()
+    scheduler.submit(Reboot(None, callback), args)
+    failed = wait()
+    return dict(reboot_time=time.perf_counter() - start, reboot_failed=failed)
+
+
+def run(args: argparse.Namespace, count: int, package_path: str) -> dict:
+    fleet = SimulatedFleet(count, latency=args.latency / 1000, bandwidth=args.bandwidth * 1024 * 1024,
+                           failure_rate=args.failure_rate, reboot_time=args.reboot_time)
+    fleet.install(package_path, dict(app_name=APP_NAME, exe_name=EXE_NAME))
+
+    # Every raspi_io connection goes to simulated fleet, reboot watcher probes through connection pool too
+    connection_pool.close()
+    connection_pool.set_factory(fleet.factory)
+    operate_metrics.clear()
+
+    result = dict(devices=count)
+    with ResourceSampler() as sampler:
+        result.update(bench_scan(fleet, args.concurrency, args.timeout))
+        result.update(bench_update(fleet, SharedPackage.open(package_path), args.timeout))
+        if not args.skip_reboot:
+            result.update(bench_reboot(fleet, args.timeout))
+
+    result.update(peak_threads=sampler.peak_threads, peak_rss=sampler.peak_rss(),
+                  p95={f'{x.key}.{x.phase}': round(x.p95, 4) for x in operate_metrics.operate_summary()})
+    return result
+
+
+def save(record: dict):
+    with open(RESULTS, 'a', encoding='utf-8') as fp:
+        fp.write(json.dumps(record) + "\n")
+
+
+def load() -> List[dict]:
+    if not os.path.isfile(RESULTS):
+        return list()
+
+    with open(RESULTS, encoding='utf-8') as fp:
+        return [json.loads(x) for x in fp if x.strip()]
+
+
+def compare(keys=('scan_time', 'update_time', 'reboot_time', 'peak_threads', 'peak_rss')):
+    """Print latest result of each commit, same params and device number in one table"""
+    latest = dict()
+    for record in load():
+        for result in record['results']:
+            latest[(json.dumps(record['params'], sort_keys=True), result['devices'], record['commit'])] = result
+
+    print('params | devices | commit | ' + ' | '.join(keys))
+    for (params, devices, commit), result in sorted(latest.items(), key=lambda x: x[0][:2]):
+        print(f'{params} | {devices} | {commit} | ' + ' | '.join(f'{result.get(k, "-")}' for k in keys))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Raspberry Pi App Manager scale benchmark')
+    parser.add_argument('--devices', type=int, nargs='+', default=[10, 100, 1000], help='fleet sizes')
+    parser.add_argument('--latency', type=float, default=5.0, help='request round trip ms')
+    parser.add_argument('--bandwidth', type=float, default=10.0, help='link rate of each device MB/s')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability of each request broken')
+    parser.add_argument('--reboot-time', type=float, default=2.0, help='seconds device stays offline after reboot')
+    parser.add_argument('--package-size', type=int, default=1024, help='app exe size KB')
+    parser.add_argument('--concurrency', type=int, default=64, help='scan concurrency')
+    parser.add_argument('--timeout', type=float, default=600.0, help='max seconds of each step')
+    parser.add_argument('--skip-reboot', action='store_true', help='do not benchmark reboot')
+    parser.add_argument('--no-save', action='store_true', help='do not append results to results.jsonl')
+    parser.add_argument('--compare', action='store_true', help='print saved results of each commit and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare()
+        return 0
+
+    params = {k: v for k, v in vars(args).items() if k not in ('devices', 'timeout', 'no_save', 'compare')}
+    record = dict(commit=git_commit(), time=time.strftime("%Y-%m-%d %H:%M:%S"), params=params, results=list())
+
+    with tempfile.TemporaryDirectory() as directory:
+        package_path = create_package(os.path.join(directory, 'bench.tar'), APP_NAME, EXE_NAME,
+                                      args.package_size * 1024)
+        for count in args.devices:
+            result = run(args, count, package_path)
+            record['results'].append(result)
+            print(json.dumps(result))
+
+    if not args.no_save:
+        save(record)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import random
+import tarfile
+import hashlib
+import threading
+from typing import List, Optional
+import raspi_io
+from payload import SharedPackage
+__all__ = ['SimulatedDevice', 'SimulatedFleet', 'create_package']
+
+
+def create_package(path: str, app_name: str, exe_name: str, size: int, version: float = 1.0) -> str:
+    """Create a fake app package, exe content is random so package is not compressible
+
+    :param path: package path
+    :param app_name: app name
+    :param exe_name: exe name inside package
+    :param size: exe size in bytes
+    :param version: app version
+    :return: package path
+    """
+    directory = f'{path}.d'
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, exe_name), 'wb') as fp:
+        fp.write(os.urandom(size))
+
+    with open(os.path.join(directory, 'version'), 'w') as fp:
+        fp.write(f'{app_name} {version}')
+
+    with tarfile.open(path, 'w') as tar:
+        for name in (exe_name, 'version'):
+            tar.add(os.path.join(directory, name), arcname=name)
+
+    return path
+
+
+class SimulatedDevice(object):
+    def __init__(self, fleet: 'SimulatedFleet', address: str, sn: str, wireless: bool):
+        self.sn = sn
+        self.fleet = fleet
+        self.address = address
+        self.wireless = wireless
+        self.apps = dict()
+        self.networks = list()
+        self.down_from = 0.0
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def is_online(self) -> bool:
+        now = time.monotonic()
+        return not self.down_from <= now < self.down_until
+
+    def request(self, size: int = 0):
+        """Simulate a request round trip, size bytes are sent at device bandwidth"""
+        fleet = self.fleet
+        if not self.is_online():
+            raise ConnectionRefusedError(f'{self.address} is offline')
+
+        time.sleep(random.uniform(fleet.latency * 0.5, fleet.latency * 1.5) + size / fleet.bandwidth)
+
+        if fleet.failure_rate and random.random() < fleet.failure_rate:
+            raise ConnectionResetError(f'{self.address} injected connection failure')
+
+        if not self.is_online():
+            raise ConnectionResetError(f'{self.address} went offline')
+
+    def reboot(self, delay: float):
+        self.down_from = time.monotonic() + delay
+        self.down_until = self.down_from + self.fleet.reboot_time
+
+    def deploy(self, path: str, desc: dict) -> dict:
+        package = SharedPackage.open(path)
+        app_name = desc.get("app_name")
+
+        with self.lock:
+            version = self.apps.get(app_name, dict()).get("version", 0.0)
+            state = dict(app_name=app_name, version=round(version + 0.1, 1), state="running",
+                         size=package.size, md5=package.member_md5(desc.get("exe_name")),
+                         release_date=time.strftime("%Y-%m-%d %H:%M:%S"))
+            self.apps[app_name] = dict(state, desc=desc)
+
+        return state
+
+
+class SimulatedClient(object):
+    def __init__(self, device: SimulatedDevice, timeout: Optional[float] = None):
+        self._device = device
+        self._since = time.monotonic()
+        self._device.request()
+
+    def _request(self, size: int = 0):
+        # Connection opened before device went down is broken, even device is back
+        if self._since <= self._device.down_from <= time.monotonic():
+            raise ConnectionResetError(f'{self._device.address} connection broken by reboot')
+
+        self._device.request(size)
+
+    # Query
+    def get_version(self) -> dict:
+        self._request()
+        return dict(server=1.0)
+
+    def get_hardware_info(self):
+        self._request()
+        return 'BCM2835', 'a02082', self._device.sn
+
+    def get_iface_list(self) -> List[str]:
+        self._request()
+        return ['wlan0'] if self._device.wireless else ['eth0']
+
+    def get_ethernet_addr(self, interface: str) -> str:
+        self._request()
+        return self._device.address
+
+    def reboot_system(self, delay: int = 0):
+        self._request()
+        self._device.reboot(delay)
+
+    # AppManager
+    def get_app_list(self) -> List[str]:
+        self._request()
+        return list(self._device.apps)
+
+    def get_app_state(self, app_name: str) -> dict:
+        self._request()
+        if app_name not in self._device.apps:
+            raise raspi_io.RaspiException(f'App {app_name!r} is not installed')
+
+        return {k: v for k, v in self._device.apps[app_name].items() if k != 'desc'}
+
+    def install(self, path: str, **desc) -> dict:
+        self._request(os.path.getsize(path))
+        return self._device.deploy(path, desc)
+
+    def local_update(self, path: str, app_name: str) -> dict:
+        self._request(os.path.getsize(path))
+        if app_name not in self._device.apps:
+            raise raspi_io.RaspiException(f'App {app_name!r} is not installed')
+
+        return self._device.deploy(path, self._device.apps[app_name]['desc'])
+
+    def uninstall(self, app_name: str) -> bool:
+        self._request()
+        return self._device.apps.pop(app_name, None) is not None
+
+    # Wireless
+    def get_networks(self) -> List[str]:
+        self._request()
+        return list(self._device.networks)
+
+    def join_network(self, **network) -> bool:
+        self._request()
+        self._device.networks.append(network.get("ssid"))
+        return True
+
+    def leave_network(self, network: str) -> bool:
+        self._request()
+        self._device.networks.remove(network)
+        return True
+
+
+class SimulatedFleet(object):
+    def __init__(self, count: int, latency: float = 0.005, bandwidth: float = 10 * 1024 * 1024,
+                 failure_rate: float = 0.0, reboot_time: float = 2.0, wireless_ratio: float = 0.3):
+        """In process raspi io server fleet, plugged into connection pool client factory
+
+        :param count: device number
+        :param latency: average request round trip seconds
+        :param bandwidth: bytes/s of each device link
+        :param failure_rate: probability of each request broken
+        :param reboot_time: seconds device stays offline after reboot
+        :param wireless_ratio: ratio of wireless only devices
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.reboot_time = reboot_time
+        self.devices = dict()
+
+        for index in range(count):
+            address = f'10.{index // 65536}.{index // 256 % 256}.{index % 256}'
+            sn = hashlib.md5(address.encode()).hexdigest()[:16]
+            self.devices[address] = SimulatedDevice(self, address, sn, random.random() < wireless_ratio)
+
+    @property
+    def addresses(self) -> List[str]:
+        return list(self.devices)
+
+    def factory(self, cls, address: str, **kwargs) -> SimulatedClient:
+        """Connection pool client factory, factory(cls, address, **kwargs) -> client"""
+        if address not in self.devices:
+            raise ConnectionRefusedError(f'{address} is not exist')
+
+        return SimulatedClient(self.devices[address], **kwargs)
+
+    def install(self, package: str, desc: dict):
+        """Preinstall app on every device"""
+        for device in self.devices.values():
+            device.deploy(package, desc)
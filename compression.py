@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import gzip
+import shutil
+import threading
+from typing import Optional, Sequence, Tuple
+from configure import AppDataDir
+from payload import SharedPackage
+from diskcache import touch, evict_lru
+__all__ = ['LinkCompressionPolicy', 'CompressedPackageCache', 'link_policy', 'compressed_cache']
+
+
+class LinkCompressionPolicy(object):
+    # (link rate upper bound in bytes/s, gzip level), slower link spends more pi cpu on decompress
+    DEFAULT_LEVELS = ((2 * 1024 * 1024, 6), (8 * 1024 * 1024, 1))
+
+    def __init__(self, levels: Sequence[Tuple[float, int]] = DEFAULT_LEVELS,
+                 unknown_level: int = 1, smoothing: float = 0.3):
+        """Choose compression level of each device from its measured transfer rate
+
+        Device io server accepting gzip compressed tar is not guaranteed, device rejected compressed package
+        is marked by reject() and is never compressed again
+
+        :param levels: (rate upper bound, level) sorted by rate, faster link than all bounds is not compressed
+        :param unknown_level: level of device without measured rate
+        :param smoothing: rate ewma factor
+        """
+        self._levels = tuple(sorted(levels))
+        self._smoothing = smoothing
+        self._unknown_level = unknown_level
+
+        self._rates = dict()
+        self._rejected = set()
+        self._lock = threading.Lock()
+
+    def rate(self, address: str) -> Optional[float]:
+        with self._lock:
+            return self._rates.get(address)
+
+    def update(self, address: str, rate: float):
+        with self._lock:
+            previous = self._rates.get(address)
+            self._rates[address] = rate if previous is None else previous + (rate - previous) * self._smoothing
+
+    def reject(self, address: str):
+        """Device io server does not accept compressed package"""
+        with self._lock:
+            self._rejected.add(address)
+
+    def level(self, address: str) -> int:
+        with self._lock:
+            if address in self._rejected:
+                return 0
+
+        rate = self.rate(address)
+        if rate is None:
+            return self._unknown_level
+
+        for bound, level in self._levels:
+            if rate < bound:
+                return level
+
+        return 0
+
+
+class CompressedPackageCache(object):
+    def __init__(self, directory: str, min_saving: float = 0.1, max_size: int = 1024 ** 3):
+        """Gzip compressed packages, each (package, level) is compressed once and shared by every device
+
+        raspi_io only sends a package by path, compressed package can't be streamed to device while it is
+        being built, so compression runs in background and package is sent uncompressed until it's ready
+
+        :param directory: compressed package directory
+        :param min_saving: compressed package saved less than min_saving is not used
+        :param max_size: max total size of compressed packages in bytes, least recently used are evicted
+        """
+        self._max_size = max_size
+        self._directory = directory
+        self._min_saving = min_saving
+
+        self._lock = threading.Lock()
+        self._compressing = set()
+
+    def _path(self, package: SharedPackage, level: int) -> str:
+        return os.path.join(self._directory, f'{package.md5}-{level}.tar.gz')
+
+    def get(self, package: SharedPackage, level: int) -> Optional[SharedPackage]:
+        """Get compressed package, start compressing it in background when not exist
+
+        :param package: original package
+        :param level: gzip level 1 - 9
+        :return: compressed package, None means compression is not ready, not worth or failed
+        """
+        if level <= 0:
+            return None
+
+        path = self._path(package, level)
+        if not os.path.isfile(path):
+            # Only compress once, failed compression is not retried, evicted one is compressed again
+            with self._lock:
+                if (package.md5, level) not in self._compressing:
+                    self._compressing.add((package.md5, level))
+                    thread = threading.Thread(target=self.threadCompress, args=(package, level, path),
+                                              name='CompressedPackageCache')
+                    thread.setDaemon(True)
+                    thread.start()
+
+            return None
+
+        try:
+            compressed = SharedPackage.open(path)
+        except OSError as e:
+            print(f'Open compressed {package} error: {e}', file=sys.stderr)
+            return None
+
+        touch(path)
+        return compressed if len(compressed) <= len(package) * (1 - self._min_saving) else None
+
+    def threadCompress(self, package: SharedPackage, level: int, path: str):
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            temp = f'{path}.tmp'
+            with open(package.path, 'rb') as src, gzip.open(temp, 'wb', compresslevel=level) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            os.replace(temp, path)
+        except OSError as e:
+            print(f'Compress {package} error: {e}', file=sys.stderr)
+            return
+
+        with self._lock:
+            self._compressing.discard((package.md5, level))
+
+        evict_lru(os.path.join(self._directory, '*.tar.gz'), self._max_size, keep=(path,))
+
+
+link_policy = LinkCompressionPolicy()
+compressed_cache = CompressedPackageCache(os.path.join(AppDataDir, 'compressed'))
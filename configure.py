@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
+import os
 from typing import List
-from PySide.QtGui import *
 
 from raspi_io.wireless import JoinNetwork
 from raspi_io.app_manager import AppState
 
 from framework.misc.settings import *
-from framework.misc.windpi import scale_size
 from framework.core.datatype import DynamicObject
 __all__ = ['RaspberryPiInfo', 'RaspberryPiSoftwareDescription', 'OnlineUpdateConfigure',
-           'UiJoinNetwork', 'UiAppState']
+           'UiJoinNetwork', 'UiAppState', 'AppDataDir']
+
+# Package store, caches and other local data
+AppDataDir = os.path.join(os.path.expanduser("~"), ".raspi-app-manager")
 
 
 class RaspberryPiInfo(DynamicObject):
@@ -69,6 +71,8 @@ class UiJoinNetwork(JsonSettings):
 
     @classmethod
     def default(cls) -> DynamicObject:
+        # Qt is only required by gui, keep it out of headless import path
+        from PySide.QtGui import QApplication
         return UiJoinNetwork(
             ssid=UiTextInput(QApplication.translate(
                 "BasicJsonSettingDialog", "Network", None, QApplication.UnicodeUTF8),
@@ -125,6 +129,8 @@ class UiAppState(JsonSettings):
 
     @classmethod
     def default(cls) -> DynamicObject:
+        from PySide.QtGui import QApplication
+        from framework.misc.windpi import scale_size
         return UiAppState(
             app_name=UiTextInput(QApplication.translate(
                 "BasicJsonSettingDialog", "Name", None, QApplication.UnicodeUTF8),
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import shutil
+import hashlib
+import tarfile
+import threading
+from typing import Dict, Optional
+from payload import SharedPackage
+from diskcache import touch, evict_lru
+from configure import AppDataDir
+__all__ = ['PackageStore', 'package_store']
+
+
+class PackageStore(object):
+    def __init__(self, directory: str, max_versions: int = 5, min_saving: float = 0.2,
+                 max_delta_size: int = 1024 ** 3):
+        """Full packages already pushed to devices, keyed by app name and version, used as delta update base
+
+        :param directory: store directory
+        :param max_versions: max versions keep for each app
+        :param min_saving: delta package should be at least min_saving smaller than full package
+        :param max_delta_size: max total size of built delta packages in bytes, lru evicted
+        """
+        self._lock = threading.Lock()
+        self._directory = directory
+        self._max_delta_size = max_delta_size
+        self._min_saving = min_saving
+        self._max_versions = max_versions
+        self._impossible = set()
+
+    @staticmethod
+    def _safe_name(name) -> str:
+        return "".join([x if x.isalnum() or x in '._-' else '_' for x in str(name)])
+
+    def _app_dir(self, app_name: str) -> str:
+        return os.path.join(self._directory, self._safe_name(app_name))
+
+    def _package_path(self, app_name: str, version) -> str:
+        return os.path.join(self._app_dir(app_name), f'{self._safe_name(version)}.tar')
+
+    def find(self, app_name: str, version) -> Optional[SharedPackage]:
+        """Find package of app specified version
+
+        :param app_name: app name
+        :param version: app version reported by device
+        :return: package or None
+        """
+        path = self._package_path(app_name, version)
+        try:
+            return SharedPackage.open(path) if version and os.path.isfile(path) else None
+        except (OSError, ValueError):
+            return None
+
+    def add(self, app_name: str, version, package: SharedPackage) -> bool:
+        """Save a package successfully updated to device as app specified version
+
+        :param app_name: app name
+        :param version: app version reported by device after update
+        :param package: package
+        :return: success return true
+        """
+        if not app_name or not version:
+            return False
+
+        path = self._package_path(app_name, version)
+        with self._lock:
+            if os.path.isfile(path):
+                return True
+
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(package.path, path + '.tmp')
+                os.replace(path + '.tmp', path)
+
+                # Drop oldest versions
+                versions = sorted(glob.glob(os.path.join(self._app_dir(app_name), '*.tar')), key=os.path.getmtime)
+                for expired in versions[:-self._max_versions]:
+                    os.remove(expired)
+
+                return True
+            except OSError as e:
+                print(f'Save package {path!r} error: {e}', file=sys.stderr)
+                return False
+
+    def delta(self, base: SharedPackage, package: SharedPackage, exe_name: str) -> Optional[SharedPackage]:
+        """Build a package without app exe, when app exe is unchanged between base and package
+
+        Device only reports app exe md5, exe is the only member can be checked after update. So only exe is
+        left out, every other member is sent. If io server replaces the app instead of extracting over it,
+        exe is gone and app state md5 mismatches, caller must fall back to full package. Deletion can't be
+        expressed in a tar, return None if any base member is removed
+
+        :param base: package installed on device
+        :param package: new package
+        :param exe_name: app exe name
+        :return: delta package, None if delta is not possible or not worth
+        """
+        delta_dir = os.path.join(self._directory, 'delta')
+        path = os.path.join(delta_dir, f'{base.md5}-{package.md5}-without-{self._safe_name(exe_name)}.tar')
+
+        with self._lock:
+            if path in self._impossible:
+                return None
+
+            try:
+                if not os.path.isfile(path) and not self._build_delta(base, package, path, exe_name):
+                    self._impossible.add(path)
+                    return None
+            except (OSError, tarfile.TarError) as e:
+                print(f'Build delta package {path!r} error: {e}', file=sys.stderr)
+                return None
+
+            touch(path)
+            evict_lru(os.path.join(delta_dir, '*.tar'), self._max_delta_size, keep=(path,))
+
+        delta = SharedPackage.open(path)
+        return delta if len(delta) <= len(package) * (1 - self._min_saving) else None
+
+    def _build_delta(self, base: SharedPackage, package: SharedPackage, path: str, exe_name: str) -> bool:
+        base_digest = self._member_digest(base.path)
+        package_digest = self._member_digest(package.path)
+        if not set(base_digest).issubset(package_digest):
+            return False
+
+        exe = [x for x in package_digest if os.path.basename(x) == exe_name]
+        if len(exe) != 1 or base_digest.get(exe[0]) != package_digest[exe[0]]:
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tarfile.open(package.path) as src, tarfile.open(path + '.tmp', 'w') as dst:
+            for member in src:
+                if member.name == exe[0]:
+                    continue
+
+                dst.addfile(member, src.extractfile(member) if member.isfile() else None)
+
+        os.replace(path + '.tmp', path)
+        return True
+
+    @staticmethod
+    def _member_digest(path: str) -> Dict[str, str]:
+        digest = dict()
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+
+                md5 = hashlib.md5()
+                fp = tar.extractfile(member)
+                for data in iter(lambda: fp.read(64 * 1024), b''):
+                    md5.update(data)
+
+                digest[member.name] = md5.hexdigest()
+
+        return digest
+
+
+package_store = PackageStore(os.path.join(AppDataDir, 'packages'))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from PySide.QtGui import *
+from PySide.QtCore import *
+from typing import Any, Optional, Sequence, Union
+from configure import RaspberryPiInfo
+from devices import DeviceStore
+__all__ = ['DeviceTableModel', 'DeviceTableView', 'CheckBoxPaintDelegate']
+
+
+class DeviceTableModel(QAbstractTableModel):
+    CHECK_COLUMN = DeviceStore.FIELDS.index('selected')
+    RESULT_COLUMN = DeviceStore.FIELDS.index('result')
+
+    def __init__(self, store: DeviceStore, parent: Optional[QWidget] = None):
+        super(DeviceTableModel, self).__init__(parent)
+        self._store = store
+        self._headers = [""] * len(DeviceStore.FIELDS)
+
+    @property
+    def store(self) -> DeviceStore:
+        return self._store
+
+    def setHeaders(self, headers: Sequence[str]):
+        self._headers = list(headers)
+        self.headerDataChanged.emit(Qt.Horizontal, 0, len(self._headers) - 1)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._store)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(DeviceStore.FIELDS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and 0 <= section < len(self._headers):
+            return self._headers[section]
+
+        return super(DeviceTableModel, self).headerData(section, orientation, role)
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        if index.column() == self.CHECK_COLUMN:
+            return Qt.NoItemFlags if self._store.record(index.row()).frozen else Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+        return Qt.ItemIsEnabled
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        row, column = index.row(), index.column()
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        elif column == self.CHECK_COLUMN:
+            return (Qt.Checked if self._store.get(row, column) else Qt.Unchecked) if role == Qt.CheckStateRole else None
+        elif role == Qt.DisplayRole:
+            return str(self._store.get(row, column))
+        elif role == Qt.BackgroundRole and column == self.RESULT_COLUMN:
+            color = self._store.record(row).color
+            return QBrush(QColor(color)) if color is not None else None
+
+        return None
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or index.column() != self.CHECK_COLUMN or role != Qt.CheckStateRole:
+            return False
+
+        if self._store.record(index.row()).frozen:
+            return False
+
+        self._store.set(index.row(), index.column(), value == Qt.Checked)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def notifyRowChanged(self, row: int, first: int = 0, last: Optional[int] = None):
+        last = self.columnCount() - 1 if last is None else last
+        self.dataChanged.emit(self.index(row, first), self.index(row, last))
+
+    def clear(self):
+        self.beginResetModel()
+        self._store.clear()
+        self.endResetModel()
+
+    def setDevice(self, info: RaspberryPiInfo, probed: Optional[float] = None) -> int:
+        row = self._store.index.row_of_sn(info.sn)
+        if row is None:
+            row = len(self._store)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._store.set_device(info, probed)
+            self.endInsertRows()
+        else:
+            self._store.set_device(info, probed)
+            self.notifyRowChanged(row)
+
+        return row
+
+
+class CheckBoxPaintDelegate(QStyledItemDelegate):
+    """Painted check box, no persistent editor for each row"""
+
+    @staticmethod
+    def _checkBoxRect(option: QStyleOptionViewItem) -> QRect:
+        button = QStyleOptionButton()
+        rect = QApplication.style().subElementRect(QStyle.SE_CheckBoxIndicator, button, None)
+        return QRect(option.rect.center() - rect.center(), rect.size())
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        button = QStyleOptionButton()
+        button.rect = self._checkBoxRect(option)
+        button.state = QStyle.State_On if index.data(Qt.CheckStateRole) == Qt.Checked else QStyle.State_Off
+        if index.flags() & Qt.ItemIsEnabled:
+            button.state |= QStyle.State_Enabled
+
+        QApplication.style().drawControl(QStyle.CE_CheckBox, button, painter)
+
+    def editorEvent(self, event: QEvent, model: QAbstractItemModel,
+                    option: QStyleOptionViewItem, index: QModelIndex) -> bool:
+        if not index.flags() & Qt.ItemIsEnabled or event.type() != QEvent.MouseButtonRelease:
+            return False
+
+        if not self._checkBoxRect(option).contains(event.pos()):
+            return False
+
+        state = Qt.Unchecked if index.data(Qt.CheckStateRole) == Qt.Checked else Qt.Checked
+        return model.setData(index, state, Qt.CheckStateRole)
+
+
+class DeviceTableView(QTableView):
+    def __init__(self, parent: Optional[QWidget] = None):
+        super(DeviceTableView, self).__init__(parent)
+        self._stretch = tuple()
+        self._max_width = dict()
+        self._model = DeviceTableModel(DeviceStore(), self)
+        self.setModel(self._model)
+        self.setItemDelegateForColumn(DeviceTableModel.CHECK_COLUMN, CheckBoxPaintDelegate(self))
+        self.horizontalHeader().setStretchLastSection(True)
+
+    @property
+    def store(self) -> DeviceStore:
+        return self._model.store
+
+    def resizeEvent(self, event: QResizeEvent):
+        super(DeviceTableView, self).resizeEvent(event)
+        width = self.viewport().width()
+        for column, factor in enumerate(self._stretch):
+            self.setColumnWidth(column, min(int(width * factor), self._max_width.get(column, width)))
+
+    def setColumnHeader(self, headers: Sequence[str]):
+        self._model.setHeaders(headers)
+
+    def setNoSelection(self):
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+
+    def setColumnStretchFactor(self, factors: Sequence[float]):
+        self._stretch = tuple(factors)
+
+    def setColumnMaxWidth(self, column: int, width: int):
+        self._max_width[column] = width
+
+    def rowCount(self) -> int:
+        return self._model.rowCount()
+
+    def setRowCount(self, count: int):
+        # Only support clear all rows
+        if count == 0:
+            self._model.clear()
+
+    def setDevice(self, info: RaspberryPiInfo, probed: Optional[float] = None) -> int:
+        return self._model.setDevice(info, probed)
+
+    def isValidRow(self, row: Optional[int]) -> bool:
+        return isinstance(row, int) and 0 <= row < self.rowCount()
+
+    def getItemData(self, row: int, column: int) -> Any:
+        return self.store.get(row, column) if self.isValidRow(row) else None
+
+    def setItemData(self, row: int, column: int, data: Any):
+        if not self.isValidRow(row):
+            return
+
+        self.store.set(row, column, data)
+        self._model.notifyRowChanged(row, column, column)
+
+    def frozenItem(self, row: int, column: int, frozen: bool):
+        if not self.isValidRow(row):
+            return
+
+        self.store.record(row).frozen = frozen
+        self._model.notifyRowChanged(row, column, column)
+
+    def getItemProperty(self, row: int, _column: int) -> Optional[RaspberryPiInfo]:
+        return self.store.record(row).info if self.isValidRow(row) else None
+
+    def setItemProperty(self, row: int, _column: int, info: RaspberryPiInfo):
+        if self.isValidRow(row):
+            self.store.record(row).info = info
+
+    def setItemBackground(self, row: int, column: int, color: Union[Qt.GlobalColor, QColor]):
+        if not self.isValidRow(row):
+            return
+
+        self.store.record(row).color = color
+        self._model.notifyRowChanged(row, column, column)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+from configure import RaspberryPiInfo
+__all__ = ['DeviceIndex', 'DeviceRecord', 'DeviceStore']
+
+
+class DeviceIndex(object):
+    def __init__(self):
+        """Device table row index keyed by serial number and address, must be kept in sync with table"""
+        self._sn = dict()  # type: Dict[str, int]
+        self._address = dict()  # type: Dict[str, int]
+        self._rows = dict()  # type: Dict[int, Tuple[str, Tuple[str, ...]]]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def clear(self):
+        self._sn.clear()
+        self._rows.clear()
+        self._address.clear()
+
+    def row_of_sn(self, sn: str) -> Optional[int]:
+        return self._sn.get(sn)
+
+    def row_of_address(self, address: str) -> Optional[int]:
+        return self._address.get(address)
+
+    def set(self, row: int, info: RaspberryPiInfo):
+        """Add or update row device
+
+        :param row: table row
+        :param info: device info
+        :return:
+        """
+        self.remove(row)
+        addresses = tuple([x for x in (info.ethernet, info.wireless) if x])
+        self._rows[row] = (info.sn, addresses)
+        self._sn[info.sn] = row
+        for address in addresses:
+            self._address[address] = row
+
+    def remove(self, row: int):
+        sn, addresses = self._rows.pop(row, ("", ()))
+        if self._sn.get(sn) == row:
+            del self._sn[sn]
+
+        for address in addresses:
+            if self._address.get(address) == row:
+                del self._address[address]
+
+
+class DeviceRecord(object):
+    __slots__ = ('info', 'selected', 'frozen', 'color', 'probed', 'stale',
+                 'revision', 'sn', 'ethernet', 'wireless', 'ios_version', 'app_version', 'app_state', 'result')
+
+    def __init__(self, info: RaspberryPiInfo):
+        self.color = None
+        self.frozen = False
+        self.load(info)
+
+    @property
+    def addresses(self) -> Tuple[str, ...]:
+        return tuple([x for x in (self.ethernet, self.wireless) if x])
+
+    def load(self, info: RaspberryPiInfo):
+        self.info = info
+        self.stale = False
+        self.probed = time.monotonic()
+        (self.selected, self.revision, self.sn, self.ethernet, self.wireless,
+         self.ios_version, self.app_version, self.app_state, self.result) = info.format_as_list()
+
+
+class DeviceStore(object):
+    # Table column -> record field, same order as RaspberryPiInfo.format_as_list
+    FIELDS = ('selected', 'revision', 'sn', 'ethernet', 'wireless', 'ios_version', 'app_version', 'app_state', 'result')
+
+    def __init__(self):
+        """Compact device table storage, one __slots__ record each row, rows indexed by sn and address"""
+        self.index = DeviceIndex()
+        self._records = list()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[DeviceRecord]:
+        return iter(self._records)
+
+    def clear(self):
+        self.index.clear()
+        self._records.clear()
+
+    def record(self, row: int) -> DeviceRecord:
+        return self._records[row]
+
+    def get(self, row: int, column: int) -> Any:
+        return getattr(self._records[row], self.FIELDS[column])
+
+    def set(self, row: int, column: int, value: Any):
+        setattr(self._records[row], self.FIELDS[column], value)
+
+    def probe_times(self) -> Dict[str, float]:
+        """Get each device address last probe time(time.monotonic)"""
+        return {address: record.probed for record in self._records for address in record.addresses}
+
+    def set_device(self, info: RaspberryPiInfo, probed: Optional[float] = None) -> Tuple[int, bool]:
+        """Add new device or reload exist device(same sn)
+
+        :param info: device info
+        :param probed: device info probe time(time.monotonic), None means just probed
+        :return: device row and is new device
+        """
+        row = self.index.row_of_sn(info.sn)
+        if row is None:
+            row = len(self._records)
+            self._records.append(DeviceRecord(info))
+            created = True
+        else:
+            record = self._records[row]
+            record.load(info)
+            record.color = None
+            record.frozen = False
+            created = False
+
+        if probed is not None:
+            self._records[row].probed = probed
+
+        self.index.set(row, info)
+        return row, created
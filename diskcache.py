@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+from typing import Sequence
+__all__ = ['touch', 'evict_lru']
+
+
+def touch(path: str):
+    """Mark a cached file as just used, file mtime is its last used time"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_lru(pattern: str, max_size: int, keep: Sequence[str] = ()) -> int:
+    """Remove least recently used cached files until total size of files matched pattern is within max_size
+
+    :param pattern: cached files glob pattern
+    :param max_size: max total size in bytes
+    :param keep: files never evicted, such as the one just returned to caller
+    :return: evicted files number
+    """
+    entries = list()
+    for path in glob.glob(pattern):
+        try:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            continue
+
+    evicted = 0
+    total = sum([x[1] for x in entries])
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+
+        if path in keep:
+            continue
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
+        evicted += 1
+
+    return evicted
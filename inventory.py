@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import sqlite3
+import contextlib
+from typing import Iterable, List
+from configure import RaspberryPiInfo
+__all__ = ['DeviceInventory']
+
+
+class DeviceInventory(object):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS devices ("
+        "sn TEXT PRIMARY KEY, revision TEXT, ethernet TEXT, wireless TEXT, "
+        "ios_version TEXT, app_state TEXT, updated REAL)",
+        "CREATE INDEX IF NOT EXISTS devices_ethernet ON devices (ethernet)",
+        "CREATE INDEX IF NOT EXISTS devices_wireless ON devices (wireless)",
+    )
+
+    def __init__(self, path: str):
+        """Persistent device inventory, last known RaspberryPiInfo of each device keyed by sn
+
+        :param path: sqlite database path
+        """
+        self._path = path
+
+    @contextlib.contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self._path)
+        try:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def load(self) -> List[RaspberryPiInfo]:
+        """Load all devices, latest updated first
+
+        :return: device info list
+        """
+        devices = list()
+        try:
+            with self._connect() as connection:
+                for sn, revision, ethernet, wireless, ios_version, app_state in connection.execute(
+                        "SELECT sn, revision, ethernet, wireless, ios_version, app_state "
+                        "FROM devices ORDER BY updated DESC"):
+                    devices.append(RaspberryPiInfo(sn=sn, revision=revision,
+                                                   ethernet=ethernet, wireless=wireless, ios_version=ios_version,
+                                                   app_state=json.loads(app_state or "{}")))
+        except (sqlite3.Error, ValueError) as e:
+            print(f'Load device inventory {self._path!r} error: {e}', file=sys.stderr)
+
+        return devices
+
+    def save(self, devices: Iterable[RaspberryPiInfo], removed: Iterable[str] = ()) -> bool:
+        """Insert or update devices and delete removed devices in one transaction
+
+        :param devices: device info list
+        :param removed: sn of devices are gone, such as devices failed a direct probe
+        :return: success return true
+        """
+        now = time.time()
+        devices = list(devices)
+        try:
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO devices "
+                    "(sn, revision, ethernet, wireless, ios_version, app_state, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(x.sn, x.revision, x.ethernet, x.wireless, x.ios_version, json.dumps(x.app_state or dict()), now)
+                     for x in devices]
+                )
+
+                connection.executemany("DELETE FROM devices WHERE sn = ?", [(x,) for x in removed])
+            return True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f'Save device inventory {self._path!r} error: {e}', file=sys.stderr)
+            return False
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import collections
+from PySide.QtGui import *
+from PySide.QtCore import *
+from typing import Any, List, Optional
+from framework.misc.settings import UiLogMessage
+__all__ = ['LogView', 'LogFileWriter']
+
+
+class LogFileWriter(object):
+    def __init__(self, path: str, max_bytes: int = 8 * 1024 * 1024, backup_count: int = 3,
+                 batch_size: int = 256, flush_interval: float = 0.5):
+        """Background log file writer, write and flush in batch, rotate when file is too large
+
+        :param path: log file path
+        :param max_bytes: rotate log file when its size exceeded max_bytes
+        :param backup_count: rotated file keep number, path.1 ... path.N
+        :param batch_size: max lines each write
+        :param flush_interval: max seconds a line stay in memory
+        """
+        self._path = path
+        self._max_bytes = max_bytes
+        self._batch_size = batch_size
+        self._backup_count = backup_count
+        self._flush_interval = flush_interval
+
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.threadWrite, name='LogFileWriter')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def write(self, line: str):
+        self._queue.put(line)
+
+    def stop(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join(self._flush_interval * 4)
+
+    def _drain(self) -> List[str]:
+        try:
+            lines = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return list()
+
+        while len(lines) < self._batch_size:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return lines
+
+    def _rotate(self):
+        for index in range(self._backup_count - 1, 0, -1):
+            if os.path.isfile(f'{self._path}.{index}'):
+                os.replace(f'{self._path}.{index}', f'{self._path}.{index + 1}')
+
+        if self._backup_count:
+            os.replace(self._path, f'{self._path}.1')
+        else:
+            os.remove(self._path)
+
+    def threadWrite(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            lines = self._drain()
+            if not lines:
+                continue
+
+            try:
+                if os.path.isfile(self._path) and os.path.getsize(self._path) >= self._max_bytes:
+                    self._rotate()
+
+                with open(self._path, 'a', encoding='utf-8') as fp:
+                    fp.write("\n".join(lines) + "\n")
+            except OSError as e:
+                print(f'Write log file {self._path!r} error: {e}', file=sys.stderr)
+
+
+class LogRingModel(QAbstractListModel):
+    def __init__(self, max_lines: int, parent: Optional[QObject] = None):
+        super(LogRingModel, self).__init__(parent)
+        self._lines = collections.deque(maxlen=max_lines)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        text, color = self._lines[index.row()]
+        if role == Qt.DisplayRole:
+            return text
+        elif role == Qt.ForegroundRole and color:
+            return QBrush(QColor(color))
+
+        return None
+
+    def append(self, text: str, color: Any):
+        if len(self._lines) == self._lines.maxlen:
+            # Drop oldest line
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self._lines.popleft()
+            self.endRemoveRows()
+
+        row = len(self._lines)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._lines.append((text, color))
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines.clear()
+        self.endResetModel()
+
+
+class LogView(QListView):
+    def __init__(self, path: str, max_lines: int = 5000, parent: Optional[QWidget] = None):
+        """Ring buffer log view, only latest max_lines are displayed, every line is written to file in background
+
+        :param path: log file path
+        :param max_lines: max lines keep in view
+        :param parent: parent widget
+        """
+        super(LogView, self).__init__(parent)
+        self._model = LogRingModel(max_lines, self)
+        self._writer = LogFileWriter(path)
+
+        self.setModel(self._model)
+        # Only visible rows are laid out and painted
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+
+    def logging(self, msg: UiLogMessage):
+        level = logging.getLevelName(msg.level) if isinstance(msg.level, int) else f'{msg.level}'
+        text = f'{time.strftime("%Y-%m-%d %H:%M:%S")} {level}: {msg.content}'
+        self._writer.write(text)
+
+        at_bottom = self.verticalScrollBar().value() == self.verticalScrollBar().maximum()
+        self._model.append(text, msg.color)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def clear(self):
+        self._model.clear()
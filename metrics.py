@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import math
+import time
+import threading
+import contextlib
+import collections
+from typing import List, Sequence, Tuple
+__all__ = ['OperateMetrics', 'PhaseSummary', 'percentile', 'operate_metrics']
+
+PhaseSummary = collections.namedtuple('PhaseSummary', ['key', 'phase', 'count', 'failed', 'p50', 'p95', 'p99', 'max'])
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    """Nearest rank percentile of sorted samples"""
+    if not samples:
+        return 0.0
+
+    return samples[min(len(samples) - 1, max(0, math.ceil(p / 100.0 * len(samples)) - 1))]
+
+
+class OperateMetrics(object):
+    # Operate phases, total is the whole operate
+    PHASES = ('connect', 'bandwidth_wait', 'transfer', 'request', 'reboot_wait', 'total')
+
+    def __init__(self, max_samples: int = 1024, max_records: int = 100000):
+        """Per operate and per device phase latency histograms
+
+        :param max_samples: latest samples keep in each histogram
+        :param max_records: latest raw records keep for export
+        """
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._records = collections.deque(maxlen=max_records)
+        self._operates = dict()
+        self._devices = dict()
+
+    def _histogram(self, histograms: dict, key: Tuple[str, str]) -> collections.deque:
+        if key not in histograms:
+            histograms[key] = collections.deque(maxlen=self._max_samples)
+
+        return histograms[key]
+
+    def record(self, operate: str, address: str, phase: str, seconds: float, success: bool = True):
+        with self._lock:
+            self._records.append((time.time(), operate, address, phase, seconds, success))
+            self._histogram(self._operates, (operate, phase)).append((seconds, success))
+            self._histogram(self._devices, (address, phase)).append((seconds, success))
+
+    @contextlib.contextmanager
+    def measure(self, operate: str, address: str, phase: str):
+        """Record with block time as phase latency, failed when block raised"""
+        start = time.perf_counter()
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            self.record(operate, address, phase, time.perf_counter() - start, success)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._devices.clear()
+            self._operates.clear()
+
+    @staticmethod
+    def _summary(histograms: dict) -> List[PhaseSummary]:
+        summary = list()
+        for (key, phase), samples in histograms.items():
+            latency = sorted(x[0] for x in samples)
+            summary.append(PhaseSummary(
+                key, phase, len(latency), sum(not x[1] for x in samples),
+                percentile(latency, 50), percentile(latency, 95), percentile(latency, 99), latency[-1]
+            ))
+
+        return summary
+
+    def operate_summary(self) -> List[PhaseSummary]:
+        """Summary of each (operate, phase), sorted by operate and phase order"""
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._operates.items()}
+
+        order = {x: i for i, x in enumerate(self.PHASES)}
+        return sorted(self._summary(histograms), key=lambda x: (x.key, order.get(x.phase, len(order))))
+
+    def device_summary(self, phase: str = 'total') -> List[PhaseSummary]:
+        """Summary of each device in phase, slowest p95 first"""
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._devices.items() if k[1] == phase}
+
+        return sorted(self._summary(histograms), key=lambda x: x.p95, reverse=True)
+
+    def export_csv(self, path: str):
+        """Export raw records"""
+        with self._lock:
+            records = list(self._records)
+
+        with open(path, 'w', newline='', encoding='utf-8') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(('time', 'operate', 'address', 'phase', 'seconds', 'success'))
+            for timestamp, operate, address, phase, seconds, success in records:
+                writer.writerow((f'{timestamp:.3f}', operate, address, phase, f'{seconds:.6f}', int(success)))
+
+    def export_json(self, path: str):
+        """Export summaries and raw records"""
+        with self._lock:
+            records = list(self._records)
+
+        data = dict(
+            operates=[x._asdict() for x in self.operate_summary()],
+            devices={phase: [x._asdict() for x in self.device_summary(phase)] for phase in self.PHASES},
+            records=[dict(time=x[0], operate=x[1], address=x[2], phase=x[3], seconds=x[4], success=x[5])
+                     for x in records]
+        )
+
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, indent=4)
+
+
+operate_metrics = OperateMetrics()
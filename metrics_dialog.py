@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from PySide.QtGui import *
+from PySide.QtCore import *
+from typing import List, Optional
+from metrics import OperateMetrics, PhaseSummary
+__all__ = ['OperateMetricsDialog']
+
+
+class OperateMetricsDialog(QDialog):
+    def __init__(self, metrics: OperateMetrics, parent: Optional[QWidget] = None):
+        """Operate phase latency percentiles of each operate and each device, export raw records
+
+        :param metrics: operate metrics
+        :param parent: parent widget
+        """
+        super(OperateMetricsDialog, self).__init__(parent)
+        self._metrics = metrics
+
+        self.ui_operates = self._createTable(self.tr("Operate"))
+        self.ui_devices = self._createTable(self.tr("Device"))
+        self.ui_phase = QComboBox(self)
+        self.ui_phase.addItems(OperateMetrics.PHASES)
+        self.ui_phase.setCurrentIndex(OperateMetrics.PHASES.index('total'))
+        self.ui_phase.currentIndexChanged.connect(self.slotRefresh)
+
+        device_layout = QVBoxLayout()
+        device_layout.addWidget(self.ui_phase)
+        device_layout.addWidget(self.ui_devices)
+        devices = QWidget(self)
+        devices.setLayout(device_layout)
+
+        tabs = QTabWidget(self)
+        tabs.addTab(self.ui_operates, self.tr("By Operate"))
+        tabs.addTab(devices, self.tr("By Device (Slowest First)"))
+
+        buttons = QDialogButtonBox(self)
+        buttons.addButton(self.tr("Refresh"), QDialogButtonBox.ActionRole).clicked.connect(self.slotRefresh)
+        buttons.addButton(self.tr("Export CSV"), QDialogButtonBox.ActionRole).clicked.connect(self.slotExportCSV)
+        buttons.addButton(self.tr("Export JSON"), QDialogButtonBox.ActionRole).clicked.connect(self.slotExportJSON)
+        buttons.addButton(self.tr("Reset"), QDialogButtonBox.ResetRole).clicked.connect(self.slotReset)
+        buttons.addButton(QDialogButtonBox.Close).clicked.connect(self.accept)
+
+        layout = QVBoxLayout()
+        layout.addWidget(tabs)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+        self.setWindowTitle(self.tr("Operate Statistics"))
+        self.resize(720, 480)
+        self.slotRefresh()
+
+    def _createTable(self, key: str) -> QTableWidget:
+        headers = (key, self.tr("Phase"), self.tr("Count"), self.tr("Failed"),
+                   "p50 (ms)", "p95 (ms)", "p99 (ms)", self.tr("Max (ms)"))
+        table = QTableWidget(0, len(headers), self)
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    @staticmethod
+    def _fillTable(table: QTableWidget, summary: List[PhaseSummary]):
+        table.setRowCount(len(summary))
+        for row, x in enumerate(summary):
+            values = (x.key, x.phase, f'{x.count}', f'{x.failed}') + \
+                tuple(f'{v * 1000:.1f}' for v in (x.p50, x.p95, x.p99, x.max))
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(Qt.AlignCenter)
+                table.setItem(row, column, item)
+
+    def slotRefresh(self):
+        self._fillTable(self.ui_operates, self._metrics.operate_summary())
+        self._fillTable(self.ui_devices, self._metrics.device_summary(self.ui_phase.currentText()))
+
+    def slotReset(self):
+        self._metrics.clear()
+        self.slotRefresh()
+
+    def _export(self, fmt: str, export):
+        from framework.gui.dialog import showFileExportDialog
+        from framework.gui.msgbox import showMessageBox, MB_TYPE_ERR
+        path = showFileExportDialog(self, fmt=fmt, title=self.tr("Export Operate Statistics"))
+        if not path:
+            return
+
+        try:
+            export(path)
+        except OSError as e:
+            showMessageBox(self, MB_TYPE_ERR, f'{e}', self.tr("Export Operate Statistics"))
+
+    def slotExportCSV(self):
+        self._export("CSV File (*.csv)", self._metrics.export_csv)
+
+    def slotExportJSON(self):
+        self._export("JSON File (*.json)", self._metrics.export_json)
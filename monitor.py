@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import time
+import heapq
+import random
+import threading
+import concurrent.futures
+from raspi_io import Query, AppManager
+from typing import Callable, Optional
+from pool import connection_pool
+__all__ = ['DeviceMonitor']
+
+
+class DeviceMonitor(object):
+    def __init__(self, changed: Callable[[str, dict], None], app_name: Callable[[], str],
+                 busy: Optional[Callable[[str], bool]] = None,
+                 error: Optional[Callable[[str, Exception], None]] = None,
+                 interval: float = 30.0, jitter: float = 0.2, concurrency: int = 4, probe_timeout: float = 3.0):
+        """Poll known devices in background, only report changed fields
+
+        Polls of all devices are spread evenly over interval with random jitter, so lan is never
+        hit in bursts. Each poll only cost a version query and an app state query
+
+        :param changed: called from monitor thread, changed(address, {field: new value})
+        :param app_name: return current app name, empty string do not poll app state
+        :param busy: return true if device is operating, busy device will be skipped
+        :param error: called from monitor thread when a device goes offline, error(address, poll error)
+        :param interval: poll interval of each device in seconds
+        :param jitter: random jitter ratio of interval
+        :param concurrency: max in-flight polls
+        :param probe_timeout: raspi_io socket timeout of each poll request, timed out device is offline
+        """
+        self._busy = busy
+        self._error = error
+        self._changed = changed
+        self._app_name = app_name
+        self._jitter = jitter
+        self._interval = interval
+        self._concurrency = concurrency
+        self._probe_timeout = probe_timeout
+
+        self._polling = set()
+        self._schedule = list()
+        self._snapshot = dict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def add(self, address: str, snapshot: Optional[dict] = None):
+        """Add device to monitor
+
+        :param address: device address
+        :param snapshot: device current known state, without snapshot the first poll only record state
+        :return:
+        """
+        with self._lock:
+            if address in self._snapshot:
+                return
+
+            self._snapshot[address] = dict(snapshot or dict())
+            heapq.heappush(self._schedule, (self._next_time(random.uniform(0, self._interval)), address))
+
+        self._wakeup.set()
+
+    def remove(self, address: str):
+        with self._lock:
+            self._snapshot.pop(address, None)
+
+    def clear(self):
+        with self._lock:
+            self._schedule.clear()
+            self._snapshot.clear()
+
+    def start(self):
+        if self.is_running():
+            return
+
+        # Spread all devices evenly over one interval
+        with self._lock:
+            addresses = list(self._snapshot)
+            step = self._interval / max(len(addresses), 1)
+            self._schedule = [(self._next_time(step * i), x) for i, x in enumerate(addresses)]
+            heapq.heapify(self._schedule)
+
+        # Each run has its own stop event, a stopped run may still be finishing its last loop
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.threadMonitor, args=(self._stopped,), name='DeviceMonitor')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _next_time(self, delay: float) -> float:
+        return time.monotonic() + delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def threadMonitor(self, stopped: threading.Event):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            while not stopped.is_set():
+                with self._lock:
+                    due, address = self._schedule[0] if self._schedule else (time.monotonic() + 1.0, None)
+                    ready = address is not None and due <= time.monotonic()
+                    if ready:
+                        heapq.heapreplace(self._schedule, (self._next_time(self._interval), address))
+
+                if not ready:
+                    self._wakeup.wait(max(0.0, due - time.monotonic()))
+                    self._wakeup.clear()
+                    continue
+
+                with self._lock:
+                    removed = address not in self._snapshot
+
+                if removed:
+                    with self._lock:
+                        self._schedule = [x for x in self._schedule if x[1] in self._snapshot]
+                        heapq.heapify(self._schedule)
+                    continue
+
+                if callable(self._busy) and self._busy(address):
+                    continue
+
+                # Previous poll of this device is still in flight
+                with self._lock:
+                    if address in self._polling:
+                        continue
+                    self._polling.add(address)
+
+                executor.submit(self._poll, address)
+
+    def _poll(self, address: str):
+        error = None
+        try:
+            # Hung device must not hold a worker, devices queued behind it would stop being polled
+            version = connection_pool.call(Query, address, 'get_version', timeout=self._probe_timeout)
+            state = dict(online=True, ios_version=version.get("server"))
+            app_name = self._app_name()
+            if app_name:
+                app_state = connection_pool.call(AppManager, address, 'get_app_state', app_name,
+                                                 timeout=self._probe_timeout)
+                state.update(app=app_state, app_version=app_state.get("version"), app_state=app_state.get("state"))
+        except Exception as e:
+            error = e
+            state = dict(online=False)
+
+        with self._lock:
+            self._polling.discard(address)
+            if address not in self._snapshot:
+                return
+
+            previous = self._snapshot[address]
+            changes = {k: v for k, v in state.items() if previous.get(k) != v}
+            self._snapshot[address] = dict(previous, **state)
+
+        # Without known state the first poll only record state
+        if changes and previous:
+            self._changed(address, changes)
+
+        # Only report why device went offline, an offline device fails every poll
+        if error is not None and "online" in changes and callable(self._error):
+            self._error(address, error)
@@ -1,20 +1,41 @@
 # -*- coding: utf-8 -*-
 import abc
 import time
-import ping3
+import errno
 import raspi_io
-from typing import Callable, Optional
+import contextlib
+from typing import Any, Callable, Optional
 from framework.misc.settings import UiLogMessage
 from framework.misc.parallel import ParallelOperate
-from framework.network.utility import wait_device_reboot
-__all__ = ['RaspiOperate', 'InstallUserApp', 'UninstallUserApp', 'Reboot', 'GetAppState',
+from pool import connection_pool
+from payload import SharedPackage
+from delta import package_store
+from compression import link_policy, compressed_cache
+from shaper import bandwidth_shaper
+from reboot import reboot_watcher
+from metrics import operate_metrics
+__all__ = ['format_rate', 'RaspiOperate', 'InstallUserApp', 'UninstallUserApp', 'Reboot', 'GetAppState',
            'LocalUpdate', 'OnlineUpdate', 'JoinWirelessNetwork', 'LeaveWirelessNetwork']
 
 
+def format_rate(rate: float) -> str:
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if rate < 1024 or unit == 'MB/s':
+            return f'{rate:.1f} {unit}'
+
+        rate /= 1024
+
+
 class RaspiOperate(ParallelOperate):
+    # Package transfer resend times and first backoff seconds after connection broken, only socket errors
+    # of an established connection are resent, unreachable device fails immediately. raspi_io sends whole
+    # file in one request, no chunk, offset or resume, so every resend restarts transfer from the first byte
+    TRANSFER_RETRIES = 3
+    TRANSFER_BACKOFF = 2.0
+    UNREACHABLE_ERRORS = (errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN)
+
     def __init__(self, logging: Optional[Callable[[UiLogMessage], None]] = None, callback: Optional[Callable] = None):
         super(RaspiOperate, self).__init__(logging, callback)
-        self.current_row = -1
 
     @abc.abstractmethod
     def _operate(self, *args, **kwargs):
@@ -23,78 +44,268 @@ class RaspiOperate(ParallelOperate):
     def _format_log(self, msg: str):
         return msg
 
-    def logging(self, msg: UiLogMessage):
-        """Show message on gui
+    def measure(self, address: str, phase: str):
+        """Record with block time as operate phase latency"""
+        return operate_metrics.measure(self.__class__.__name__, address, phase)
+
+    @contextlib.contextmanager
+    def connect(self, cls, address: str, phase: str = 'request', **kwargs):
+        """Borrow a pooled raspi_io connection, use it as context manager
+
+        Borrow time is recorded as connect phase, with block time is recorded as phase
+        """
+        start = time.perf_counter()
+        with connection_pool.connection(cls, address, **kwargs) as client:
+            operate_metrics.record(self.__class__.__name__, address, 'connect', time.perf_counter() - start)
+            with self.measure(address, phase):
+                yield client
+
+    def transfer(self, index: int, address: str, package: SharedPackage,
+                 send: Callable[[raspi_io.AppManager], Any], expected_md5: str = "") -> Any:
+        """Send package over a pooled app manager connection, reconnect and resend when connection broken
+
+        Interrupted transfer is resent from beginning after exponential backoff, connect failure(refused,
+        unreachable) and server side errors are raised immediately, result dict carries transfer rate and attempts
+
+        :param index: device row, for logging
+        :param address: device address
+        :param package: package to send
+        :param send: send(manager) -> result
+        :param expected_md5: app exe md5 after transfer, mismatched result raises RuntimeError
+        :return: send result
+        """
+        for attempt in range(self.TRANSFER_RETRIES + 1):
+            # Bulk transfer shares average bandwidth with all other workers, bytes on the wire are not paced
+            with self.measure(address, 'bandwidth_wait'):
+                bandwidth_shaper.acquire(address, len(package))
+
+            start = time.perf_counter()
+            connected = False
+            try:
+                with self.connect(raspi_io.AppManager, address, phase='transfer', timeout=300) as manager:
+                    connected = True
+                    result = send(manager)
+
+                if not isinstance(result, dict):
+                    return result
+
+                # Server installed what it received, resending same package gives same result
+                md5 = str(result.get("md5", "")).lower()
+                if expected_md5 and md5 and md5 != expected_md5.lower():
+                    raise RuntimeError(f'Transfer {package} md5 mismatched {md5!r} != {expected_md5!r}')
+
+                rate = len(package) / max(time.perf_counter() - start, 1e-6)
+                link_policy.update(address, rate)
+                return dict(result, transfer_rate=rate, transfer_attempts=attempt + 1)
+            except connection_pool.SOCKET_ERRORS as e:
+                # Device is offline, resending only waits for backoff
+                refused = isinstance(e, ConnectionRefusedError)
+                if not connected or refused or getattr(e, 'errno', None) in self.UNREACHABLE_ERRORS:
+                    raise
+
+                error = f'{e}'
+
+            if attempt == self.TRANSFER_RETRIES:
+                raise RuntimeError(f'Transfer failed after {attempt + 1} attempts: {error}')
+
+            # Connection may be half broken, next attempt must reconnect
+            connection_pool.discard(address)
+            delay = self.TRANSFER_BACKOFF * 2 ** attempt
+            self.logging(UiLogMessage.genDefaultInfoMessage(
+                f'Transfer {package} failed: {error}, retry {attempt + 1}/{self.TRANSFER_RETRIES} after {delay}s'
+            ), index)
+            time.sleep(delay)
+
+    def send_package(self, index: int, address: str, package: SharedPackage, compress: bool,
+                     send: Callable[[raspi_io.AppManager, str], Any], expected_md5: str = "") -> Any:
+        """Transfer package, compressed by device link rate when compress is set
+
+        Device rejected compressed package with a server error is remembered and package is resent uncompressed
+
+        :param index: device row, for logging
+        :param address: device address
+        :param package: package to send
+        :param compress: send compressed package if it's worth
+        :param send: send(manager, path) -> result
+        :param expected_md5: app exe md5 after transfer
+        :return: send result
+        """
+        payload = self.compress(index, address, package) if compress else package
+        try:
+            return self.transfer(index, address, payload, lambda x: send(x, payload.path), expected_md5)
+        except raspi_io.RaspiException as e:
+            if payload is package:
+                raise
+
+            link_policy.reject(address)
+            self.logging(UiLogMessage.genDefaultInfoMessage(f'Compressed package rejected: {e}, send uncompressed'),
+                         index)
+
+        return self.transfer(index, address, package, lambda x: send(x, package.path), expected_md5)
+
+    def compress(self, index: int, address: str, package: SharedPackage) -> SharedPackage:
+        """Choose compressed package by device measured link rate, compressed package is shared by all devices"""
+        level = link_policy.level(address)
+        compressed = compressed_cache.get(package, level)
+        if compressed is None:
+            return package
+
+        self.logging(UiLogMessage.genDefaultInfoMessage(
+            f'Compressed transfer level {level}: {len(compressed)}/{len(package)} bytes'
+        ), index)
+        return compressed
+
+    def logging(self, msg: UiLogMessage, index: int = -1):
+        """Show message on gui, operate instance is shared by all workers so row is always passed explicitly
 
         :param msg: msg content
+        :param index: device row, -1 means not belongs to any device
         :return:
         """
         if callable(self._logging) and isinstance(msg, UiLogMessage):
-            self._logging(msg, self.current_row)
+            self._logging(msg, index)
 
     def run(self, *args, **kwargs):
+        start = time.perf_counter()
         try:
-            self.current_row = args[0]
             result = self._operate(*args, **kwargs)
         except Exception as e:
             result = f'{e}'
-            print(f'{self.__class__.__name__!r} operate error: {e}')
-            self.errorLogging(f'{self.__class__.__name__!r} operate error: {e}')
+            self.logging(UiLogMessage.genDefaultErrorMessage(f'{self.__class__.__name__!r} operate error: {e}'),
+                         args[0])
 
-        self.callback(result, *args)
+        self._finish(result, start, args)
         return result
 
+    def _finish(self, result: Any, start: float, args: tuple):
+        """Record operate total time and report result"""
+        success = not isinstance(result, str) and result is not False
+        operate_metrics.record(self.__class__.__name__, args[1], 'total', time.perf_counter() - start, success)
+        self.callback(result, *args)
+
 
 class Reboot(RaspiOperate):
-    def _operate(self, index: int, address: str) -> bool:
-        query = raspi_io.Query(address)
-        query.reboot_system(delay=3)
-        time.sleep(3)
-        return all(wait_device_reboot(address))
+    DELAY = 3
+
+    def _operate(self, index: int, address: str) -> Any:
+        # Reboot is detected by this session broken, without it reboot can't be tracked so it's not sent
+        session = reboot_watcher.open(address)
+        with self.connect(raspi_io.Query, address) as query:
+            query.reboot_system(delay=self.DELAY)
+
+        # Connections will be broken after reboot
+        connection_pool.discard(address)
+        return session
+
+    def _finish(self, result: Any, start: float, args: tuple):
+        """Reboot command sent, worker is released immediately, result is reported when reboot watcher done"""
+        if isinstance(result, str):
+            return super(Reboot, self)._finish(result, start, args)
+
+        def rebooted(success: bool):
+            operate_metrics.record(self.__class__.__name__, args[1], 'reboot_wait', time.perf_counter() - wait, success)
+            super(Reboot, self)._finish(success, start, args)
+
+        wait = time.perf_counter()
+        reboot_watcher.watch(args[1], result, rebooted, delay=self.DELAY)
 
 
 class GetAppState(RaspiOperate):
     def _operate(self, index: int, address: str, app_name: str) -> dict:
-        manager = raspi_io.AppManager(address, timeout=300)
-        return manager.get_app_state(app_name)
+        with self.connect(raspi_io.AppManager, address, timeout=300) as manager:
+            return manager.get_app_state(app_name)
 
 
 class LocalUpdate(RaspiOperate):
-    def _operate(self, index: int, address: str, app_name: str, update_package: str) -> dict:
-        manager = raspi_io.AppManager(address, timeout=300)
-        if app_name not in manager.get_app_list():
-            raise RuntimeError(f"App {app_name!r} is not installed, please install app first")
-        return manager.local_update(update_package, app_name)
+    def _operate(self, index: int, address: str, app_name: str, update_package: SharedPackage,
+                 skip_md5: str = "", delta_exe: str = "", compress: bool = False) -> dict:
+        with self.connect(raspi_io.AppManager, address, timeout=300) as manager:
+            if app_name not in manager.get_app_list():
+                raise RuntimeError(f"App {app_name!r} is not installed, please install app first")
+
+            app_state = manager.get_app_state(app_name) if skip_md5 or delta_exe else dict()
+            device_md5 = str(app_state.get("md5", "")).lower()
+
+            # Device app exe is identical to package, skip transfer
+            if skip_md5 and device_md5 == skip_md5.lower():
+                return dict(app_state, skipped=True)
+
+            delta = None
+            if delta_exe:
+                # Only send delta when stored base is exactly what device is running
+                base = package_store.find(app_name, app_state.get("version"))
+                if base is not None and base.member_md5(delta_exe) == device_md5:
+                    delta = package_store.delta(base, update_package, delta_exe)
+
+        if delta is None:
+            result = self._send(index, address, app_name, update_package, compress, skip_md5)
+        else:
+            result = self._send_delta(index, address, app_name, delta, update_package, delta_exe, compress)
+
+        package_store.add(app_name, result.get("version"), update_package)
+        return result
+
+    def _send(self, index: int, address: str, app_name: str, package: SharedPackage, compress: bool,
+              expected_md5: str = ""):
+        return self.send_package(index, address, package, compress, lambda x, path: x.local_update(path, app_name),
+                                 expected_md5)
+
+    def _send_delta(self, index: int, address: str, app_name: str, delta: SharedPackage, package: SharedPackage,
+                    exe_name: str, compress: bool) -> dict:
+        """Send delta package, resend full package when device app exe does not match package after update
+
+        Delta carries every member except unchanged app exe, exe md5 reported after update proves it was
+        extracted over the installed app, a device replaced the app loses exe and gets full package
+        """
+        self.logging(UiLogMessage.genDefaultInfoMessage(f'Delta update {len(delta)}/{len(package)} bytes'), index)
+        expected_md5 = package.member_md5(exe_name)
+
+        try:
+            result = self._send(index, address, app_name, delta, compress)
+            with self.connect(raspi_io.AppManager, address, timeout=300) as manager:
+                md5 = str(manager.get_app_state(app_name).get("md5", "")).lower()
+
+            if isinstance(result, dict) and expected_md5 and md5 == expected_md5:
+                return result
+
+            error = f'exe md5 {md5!r} != {expected_md5!r}'
+        except (raspi_io.RaspiException, RuntimeError, OSError) as e:
+            error = f'{e}'
+
+        self.logging(UiLogMessage.genDefaultInfoMessage(f'Delta update not applied: {error}, send full package'),
+                     index)
+        return self._send(index, address, app_name, package, compress, expected_md5)
 
 
 class OnlineUpdate(RaspiOperate):
     def _operate(self, index: int, address: str, auth: dict, release: dict, repo: str) -> dict:
-        manager = raspi_io.AppManager(address, timeout=300)
-        return manager.online_update(auth, release, repo)
+        with self.connect(raspi_io.AppManager, address, timeout=300) as manager:
+            return manager.online_update(auth, release, repo)
 
 
 class InstallUserApp(RaspiOperate):
-    def _operate(self, index: int, address: str, package: str, desc: dict) -> dict:
-        manager = raspi_io.AppManager(address, timeout=300)
-        return manager.install(package, **desc)
+    def _operate(self, index: int, address: str, package: SharedPackage, desc: dict, compress: bool = False) -> dict:
+        result = self.send_package(index, address, package, compress, lambda x, path: x.install(path, **desc))
+        package_store.add(desc.get("app_name"), result.get("version"), package)
+        return result
 
 
 class UninstallUserApp(RaspiOperate):
     def _operate(self, index: int, address: str, app_name: str) -> bool:
-        manager = raspi_io.AppManager(address, timeout=300)
-        return manager.uninstall(app_name)
+        with self.connect(raspi_io.AppManager, address, timeout=300) as manager:
+            return manager.uninstall(app_name)
 
 
 class JoinWirelessNetwork(RaspiOperate):
     def _operate(self, index: int, address: str, network: dict) -> bool:
-        wireless = raspi_io.Wireless(address)
-        return wireless.join_network(**network)
+        with self.connect(raspi_io.Wireless, address) as wireless:
+            return wireless.join_network(**network)
 
 
 class LeaveWirelessNetwork(RaspiOperate):
     def _operate(self, index: int, address: str, network_name: str) -> bool:
-        wireless = raspi_io.Wireless(address)
-        if network_name not in wireless.get_networks():
-            raise RuntimeError(f'Network {network_name!r} is not exist')
+        with self.connect(raspi_io.Wireless, address) as wireless:
+            if network_name not in wireless.get_networks():
+                raise RuntimeError(f'Network {network_name!r} is not exist')
 
-        return wireless.leave_network(network_name)
+            return wireless.leave_network(network_name)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import tarfile
+import threading
+import weakref
+from typing import Any, Callable, Tuple
+__all__ = ['SharedPackage']
+
+
+class SharedPackage(object):
+    _lock = threading.Lock()
+    _opened = weakref.WeakValueDictionary()
+
+    def __init__(self, path: str):
+        """Update package read and hashed once, size, md5 and member md5 are shared by every upload worker
+
+        raspi_io AppManager only accepts a package path and reads the file itself, so package content
+        can't be handed over from a shared buffer, workers only share the path and the hashes
+
+        :param path: package path
+        """
+        self.path = os.path.realpath(path)
+        self.size = 0
+        md5 = hashlib.md5()
+        with open(self.path, 'rb') as fp:
+            for data in iter(lambda: fp.read(1024 * 1024), b''):
+                md5.update(data)
+                self.size += len(data)
+
+        self.md5 = md5.hexdigest()
+        self._member_md5 = dict()
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'{os.path.basename(self.path)}({self.size} bytes, md5: {self.md5})'
+
+    @staticmethod
+    def _identity(path: str) -> Tuple[str, int, int]:
+        stat = os.stat(path)
+        return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def open(cls, path: str):
+        """Open package, same unchanged package only read once while anyone still hold it
+
+        :param path: package path
+        :return: SharedPackage
+        """
+        identity = cls._identity(path)
+        with cls._lock:
+            package = cls._opened.get(identity)
+            if package is None:
+                package = cls(path)
+                cls._opened[identity] = package
+
+            return package
+
+    def member_md5(self, name: str) -> str:
+        """Get md5 of a regular file inside package, same as app exe md5 reported by device
+
+        :param name: member file name, match with member basename
+        :return: member md5, empty string if member not found or package is not a tar file
+        """
+        with self._lock:
+            if name in self._member_md5:
+                return self._member_md5[name]
+
+        digest = ""
+        try:
+            with tarfile.open(self.path) as tar:
+                for member in tar:
+                    if member.isfile() and os.path.basename(member.name) == name:
+                        md5 = hashlib.md5()
+                        fp = tar.extractfile(member)
+                        for data in iter(lambda: fp.read(64 * 1024), b''):
+                            md5.update(data)
+
+                        digest = md5.hexdigest()
+                        break
+        except (OSError, tarfile.TarError):
+            digest = ""
+
+        with self._lock:
+            self._member_md5[name] = digest
+
+        return digest
+
+    def verifier(self, exe_name: str) -> Callable[[Any], bool]:
+        """Get operate result verifier, result should be an app state reporting same exe md5 as package
+
+        :param exe_name: app exe name, empty or not found in package only check result is an app state
+        :return: verify(result) -> bool
+        """
+        exe_md5 = self.member_md5(exe_name) if exe_name else ""
+
+        def verify(result: Any) -> bool:
+            if not isinstance(result, dict):
+                return False
+
+            return not exe_md5 or not result.get("md5") or str(result.get("md5")).lower() == exe_md5
+
+        return verify
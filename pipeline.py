@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import collections
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from operate import RaspiOperate
+__all__ = ['PipelineStage', 'OperatePipeline']
+
+
+class PipelineStage(object):
+    __slots__ = ['name', 'operate', 'args', 'concurrency', 'verify']
+
+    def __init__(self, name: str, operate: type, args: Tuple[Any, ...] = (), concurrency: int = 32,
+                 verify: Optional[Callable[[Any], bool]] = None):
+        """Single step of pipeline
+
+        :param name: stage name shown on gui
+        :param operate: RaspiOperate subclass
+        :param args: operate args after (row, address)
+        :param concurrency: max devices in this stage at same time
+        :param verify: verify operate result, default result is not a error message or false
+        """
+        self.name = name
+        self.args = tuple(args)
+        self.operate = operate
+        self.verify = verify
+        self.concurrency = max(1, concurrency)
+
+
+class OperatePipeline(object):
+    def __init__(self, stages: Sequence[PipelineStage],
+                 submit: Callable[[RaspiOperate, List[Tuple[Any, ...]]], None],
+                 logging: Optional[Callable] = None,
+                 progress: Optional[Callable[[PipelineStage, bool, Any, int, str], None]] = None,
+                 finished: Optional[Callable[[bool, Optional[PipelineStage], int, str], None]] = None):
+        """Run stages one by one on each device, no barrier between devices
+
+        A device enters next stage as soon as it passed current stage, a failed device stops at failed stage
+
+        :param stages: pipeline stages
+        :param submit: submit(operate, args list) run operate with each args
+        :param logging: operate logging
+        :param progress: called when device finished a stage, progress(stage, passed, result, row, address)
+        :param finished: called when device left pipeline, finished(success, failed stage or None, row, address)
+        """
+        self._stages = list(stages)
+        self._submit = submit
+        self._progress = progress
+        self._finished = finished
+
+        self._lock = threading.Lock()
+        self._running = [0] * len(self._stages)
+        self._pending = [collections.deque() for _ in self._stages]
+        self._operates = [stage.operate(logging, self._callback(index)) for index, stage in enumerate(self._stages)]
+
+    def _callback(self, index: int) -> Callable:
+        def callback(result: Any, row: int, address: str, *_args):
+            self._stage_finished(index, result, row, address)
+
+        return callback
+
+    @staticmethod
+    def _passed(stage: PipelineStage, result: Any) -> bool:
+        if callable(stage.verify):
+            try:
+                return bool(stage.verify(result))
+            except Exception as e:
+                print(f'Verify {stage.name!r} result error: {e}', file=sys.stderr)
+                return False
+
+        return not isinstance(result, str) and result is not False
+
+    def start(self, devices: Sequence[Tuple[int, str]]):
+        if not self._stages:
+            return
+
+        with self._lock:
+            self._pending[0].extend(devices)
+
+        self._dispatch(0)
+
+    def _dispatch(self, index: int):
+        if index >= len(self._stages):
+            return
+
+        stage = self._stages[index]
+        with self._lock:
+            ready = list()
+            while self._pending[index] and self._running[index] < stage.concurrency:
+                self._running[index] += 1
+                ready.append(self._pending[index].popleft())
+
+        if ready:
+            self._submit(self._operates[index], [(row, address) + stage.args for row, address in ready])
+
+    def _stage_finished(self, index: int, result: Any, row: int, address: str):
+        stage = self._stages[index]
+        passed = self._passed(stage, result)
+
+        with self._lock:
+            self._running[index] -= 1
+            last = index + 1 == len(self._stages)
+            if passed and not last:
+                self._pending[index + 1].append((row, address))
+
+        if callable(self._progress):
+            self._progress(stage, passed, result, row, address)
+
+        if (not passed or last) and callable(self._finished):
+            self._finished(passed, None if passed else stage, row, address)
+
+        self._dispatch(index)
+        self._dispatch(index + 1)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import contextlib
+import raspi_io
+from raspi_io.core import RaspiSocketError
+from typing import Callable, Tuple, Any, Optional
+__all__ = ['ConnectionPool', 'connection_pool']
+
+
+class PooledConnection(object):
+    __slots__ = ('client', 'lock', 'last_used', 'last_check')
+
+    def __init__(self):
+        self.client = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.last_check = self.last_used
+
+
+class ConnectionPool(object):
+    # Cheapest request of each client type, used as health check
+    HEALTH_CHECK = {
+        raspi_io.Query: lambda client: client.get_version(),
+        raspi_io.AppManager: lambda client: client.get_app_list(),
+        raspi_io.Wireless: lambda client: client.get_networks(),
+    }
+
+    # Errors mean connection is broken, connection will be dropped and reconnect on next acquire
+    CONNECTION_ERRORS = (raspi_io.RaspiException, OSError)
+
+    # Errors mean request never reached or never came back from server, resending may succeed
+    SOCKET_ERRORS = (RaspiSocketError, OSError)
+
+    def __init__(self, idle_timeout: float = 120.0, check_interval: float = 15.0,
+                 factory: Optional[Callable[..., Any]] = None):
+        """Per address raspi_io client pool shared by scanner and all operates
+
+        :param idle_timeout: connection not used in idle_timeout seconds will be evicted
+        :param check_interval: connection idled more than check_interval will be health checked before reuse
+        :param factory: client factory, factory(cls, address, **kwargs) -> client, default is cls(address, **kwargs)
+        """
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._idle_timeout = idle_timeout
+        self._check_interval = check_interval
+        self._factory = factory or (lambda cls, address, **kwargs: cls(address, **kwargs))
+        self._connections = dict()
+
+    def __len__(self):
+        with self._lock:
+            return len([x for x in self._connections.values() if x.client is not None])
+
+    @staticmethod
+    def _key(cls, address: str, kwargs: dict) -> Tuple:
+        return cls, address, tuple(sorted(kwargs.items()))
+
+    def set_factory(self, factory: Callable[..., Any]):
+        self.close()
+        self._factory = factory
+
+    def create(self, cls, address: str, **kwargs):
+        """Create a dedicated connection not shared with pool, by same client factory
+
+        :param cls: raspi_io client class
+        :param address: device address
+        :param kwargs: client kwargs, like timeout
+        :return: client
+        """
+        return self._factory(cls, address, **kwargs)
+
+    @contextlib.contextmanager
+    def connection(self, cls, address: str, **kwargs):
+        """Borrow a connection, connection is exclusively hold inside with block
+
+        :param cls: raspi_io client class, Query, AppManager, Wireless, etc
+        :param address: device address
+        :param kwargs: client kwargs, like timeout
+        :return: client
+        """
+        self.evict_idle()
+
+        with self._lock:
+            entry = self._connections.setdefault(self._key(cls, address, kwargs), PooledConnection())
+
+        with entry.lock:
+            now = time.monotonic()
+            if entry.client is not None and now - entry.last_used > self._check_interval:
+                entry.last_check = now
+                if not self._is_healthy(entry.client):
+                    entry.client = None
+
+            if entry.client is None:
+                entry.client = self._factory(cls, address, **kwargs)
+                entry.last_check = now
+
+            try:
+                yield entry.client
+            except self.CONNECTION_ERRORS:
+                entry.client = None
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+    def call(self, cls, address: str, method: str, *args, timeout: Optional[float] = None):
+        """Call idempotent request with pooled connection, reconnect and retry once if connection is broken
+
+        :param cls: raspi_io client class
+        :param address: device address
+        :param method: request method name
+        :param args: request args
+        :param timeout: client timeout, None use client default
+        :return: request result
+        """
+        kwargs = dict(timeout=timeout) if timeout is not None else dict()
+        for retry in (True, False):
+            try:
+                with self.connection(cls, address, **kwargs) as client:
+                    return getattr(client, method)(*args)
+            except self.CONNECTION_ERRORS:
+                if not retry:
+                    raise
+
+    def discard(self, address: str):
+        """Drop all connections of address, device reboot or address changed"""
+        with self._lock:
+            for key in [x for x in self._connections if x[1] == address]:
+                self._connections.pop(key).client = None
+
+    def evict_idle(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_sweep < 1.0:
+            return
+
+        self._last_sweep = now
+        with self._lock:
+            for key, entry in list(self._connections.items()):
+                if now - entry.last_used > self._idle_timeout and entry.lock.acquire(blocking=False):
+                    try:
+                        del self._connections[key]
+                        entry.client = None
+                    finally:
+                        entry.lock.release()
+
+    def close(self):
+        with self._lock:
+            for entry in self._connections.values():
+                entry.client = None
+
+            self._connections.clear()
+
+    def _is_healthy(self, client) -> bool:
+        check = self.HEALTH_CHECK.get(type(client))
+        if not callable(check):
+            return True
+
+        try:
+            check(client)
+            return True
+        except self.CONNECTION_ERRORS:
+            return False
+
+
+# Shared by scanner, operates and gui
+connection_pool = ConnectionPool()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Headless raspi app manager, drive operates and scanner without gui, print events as json lines
+
+    raspi-app-cli.py scan --subnet 192.168.1.0/24
+    raspi-app-cli.py deploy --devices 192.168.1.10 192.168.1.11 --app app.json --package app.tar --network wifi.json
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+
+# Heavy modules(raspi_io, framework, operate ...) are imported on demand, keep startup fast
+COMMANDS = ('scan', 'state', 'install', 'update', 'uninstall', 'reboot', 'deploy')
+APP_COMMANDS = ('state', 'install', 'update', 'uninstall', 'deploy')
+PACKAGE_COMMANDS = ('install', 'update', 'deploy')
+
+
+class JsonLinePrinter(object):
+    def __init__(self, stream=sys.stdout):
+        self._lock = threading.Lock()
+        self._stream = stream
+
+    def __call__(self, event: str, **kwargs):
+        line = json.dumps(dict(event=event, time=round(time.time(), 3), **kwargs), default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Raspberry Pi App Manager headless batch runner')
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('--devices', nargs='+', default=list(), metavar='ADDRESS', help='device address list')
+    parser.add_argument('--devices-file', default='', metavar='PATH', help='device address file, one per line')
+    parser.add_argument('--subnet', default='', help='scan subnet to find devices, e.g. 192.168.1.0/24')
+    parser.add_argument('--app', default='', metavar='PATH', help='app description json')
+    parser.add_argument('--package', default='', metavar='PATH', help='app package tar file')
+    parser.add_argument('--network', default='', metavar='PATH', help='deploy join wireless network json')
+    parser.add_argument('--skip-identical', action='store_true', help='update skip device already running package')
+    parser.add_argument('--delta', action='store_true', help='update skip sending app exe when it is unchanged')
+    parser.add_argument('--compress', action='store_true', help='compress package by each device link rate')
+    parser.add_argument('--rate-limit', type=float, default=0.0, metavar='MB/s',
+                        help='average total transfer rate of all devices, 0 is unlimited')
+    parser.add_argument('--metrics', default='', metavar='PATH',
+                        help='export operate phase latency statistics, .csv or .json')
+    parser.add_argument('--concurrency', type=int, default=64, help='scan concurrency')
+    parser.add_argument('--scan-timeout', type=float, default=120.0, help='scan timeout in seconds')
+    args = parser.parse_args(argv)
+
+    if args.command in APP_COMMANDS and not args.app:
+        parser.error(f'{args.command!r} requires --app')
+
+    if args.command in PACKAGE_COMMANDS and not args.package:
+        parser.error(f'{args.command!r} requires --package')
+
+    return args
+
+
+def load_addresses(args: argparse.Namespace) -> list:
+    addresses = list(args.devices)
+    if args.devices_file:
+        with open(args.devices_file, encoding='utf-8') as fp:
+            addresses.extend(x.strip() for x in fp if x.strip() and not x.startswith('#'))
+
+    return list(dict.fromkeys(addresses))
+
+
+def scan(args: argparse.Namespace, addresses: list, app_name: str, emit: JsonLinePrinter) -> list:
+    from scanner import FleetScanner, describe_device
+
+    if addresses:
+        candidates = iter(addresses)
+    elif args.subnet:
+        import ipaddress
+        candidates = (f'{x}' for x in ipaddress.ip_network(args.subnet, strict=False).hosts())
+    else:
+        from raspi_io.utility import scan_server
+        candidates = scan_server(timeout=0.05)
+
+    devices = list()
+    finished = threading.Event()
+
+    async def probe(address: str, run):
+        device, timings = await describe_device(address, app_name, run)
+        return address, device, timings
+
+    def found(result):
+        address, device, timings = result
+        devices.append(address)
+        emit('found', address=address, device=device.dict, timings=timings)
+
+    def error(address: str, e: Exception):
+        # Subnet scan probes every host, only explicit address error is meaningful
+        if addresses:
+            emit('error', address=address, error=f'{e}')
+
+    def scan_finished(statistics):
+        emit('scan_finished', found=statistics.found, failed=statistics.failed,
+             timeout=statistics.timeout, elapsed=round(statistics.elapsed, 3))
+        finished.set()
+
+    scanner = FleetScanner(probe, found, error=error, finished=scan_finished,
+                           concurrency=args.concurrency, scan_timeout=args.scan_timeout)
+    scanner.scan(candidates)
+    finished.wait()
+    return devices
+
+
+def build_stages(args: argparse.Namespace, app_config) -> list:
+    import operate
+    from pipeline import PipelineStage
+    from payload import SharedPackage
+
+    package = SharedPackage.open(args.package) if args.command in PACKAGE_COMMANDS else None
+    app_name = app_config.app_name if app_config is not None else ''
+    exe_md5 = package.member_md5(app_config.exe_name) if package is not None else ''
+    verify = package.verifier(app_config.exe_name) if package is not None else lambda x: isinstance(x, dict)
+
+    install_args = (package, app_config.dict if app_config is not None else dict(), args.compress)
+    if args.command == 'state':
+        return [PipelineStage('state', operate.GetAppState, (app_name,), verify=lambda x: isinstance(x, dict))]
+    elif args.command == 'install':
+        return [PipelineStage('install', operate.InstallUserApp, install_args, 8, verify)]
+    elif args.command == 'update':
+        skip_md5 = exe_md5 if args.skip_identical else ''
+        delta_exe = app_config.exe_name if args.delta else ''
+        return [PipelineStage('update', operate.LocalUpdate, (app_name, package, skip_md5, delta_exe, args.compress),
+                              8, verify)]
+    elif args.command == 'uninstall':
+        return [PipelineStage('uninstall', operate.UninstallUserApp, (app_name,), verify=lambda x: x is True)]
+    elif args.command == 'reboot':
+        return [PipelineStage('reboot', operate.Reboot, concurrency=1024, verify=lambda x: x is True)]
+
+    stages = [PipelineStage('install', operate.InstallUserApp, install_args, 8, verify)]
+    if args.network:
+        with open(args.network, encoding='utf-8') as fp:
+            network = json.load(fp)
+
+        stages.append(PipelineStage('join_network', operate.JoinWirelessNetwork, (network,),
+                                    verify=lambda x: x is True))
+
+    stages.append(PipelineStage('reboot', operate.Reboot, concurrency=1024, verify=lambda x: x is True))
+    stages.append(PipelineStage('verify', operate.GetAppState, (app_name,), verify=verify))
+    return stages
+
+
+def run_pipeline(stages: list, addresses: list, emit: JsonLinePrinter) -> int:
+    from pipeline import OperatePipeline
+    from scheduler import OperateScheduler
+
+    lock = threading.Lock()
+    done = threading.Event()
+    remaining = [len(addresses)]
+    failed = list()
+
+    def logging(msg, row: int):
+        emit('log', address=addresses[row], level=msg.level, message=msg.content)
+
+    def progress(stage, passed: bool, result, row: int, address: str):
+        emit('stage', address=address, stage=stage.name, passed=passed, result=result)
+
+    def finished(success: bool, stage, row: int, address: str):
+        emit('result', address=address, success=success, failed_stage=stage.name if stage is not None else None)
+        with lock:
+            if not success:
+                failed.append(address)
+
+            remaining[0] -= 1
+            if remaining[0] <= 0:
+                done.set()
+
+    pipeline = OperatePipeline(stages, OperateScheduler().submit, logging, progress, finished)
+    pipeline.start(list(enumerate(addresses)))
+    done.wait()
+    return len(failed)
+
+
+def main(argv=None) -> int:
+    start = time.perf_counter()
+    args = parse_args(argv)
+    emit = JsonLinePrinter()
+
+    try:
+        app_config = None
+        if args.app:
+            from configure import RaspberryPiSoftwareDescription
+            app_config = RaspberryPiSoftwareDescription.load(args.app)
+
+        addresses = load_addresses(args)
+        if args.command == 'scan' or not addresses:
+            addresses = scan(args, addresses, app_config.app_name if app_config is not None else '', emit)
+
+        if args.rate_limit > 0:
+            from shaper import bandwidth_shaper
+            bandwidth_shaper.rate = args.rate_limit * 1024 * 1024
+
+        failed = 0
+        if not addresses:
+            emit('error', error='no device found')
+        elif args.command != 'scan':
+            failed = run_pipeline(build_stages(args, app_config), addresses, emit)
+
+        if args.metrics:
+            from metrics import operate_metrics
+            export = operate_metrics.export_csv if args.metrics.endswith('.csv') else operate_metrics.export_json
+            export(args.metrics)
+            emit('metrics', summary=[x._asdict() for x in operate_metrics.operate_summary()], path=args.metrics)
+
+        emit('summary', command=args.command, total=len(addresses), failed=failed,
+             elapsed=round(time.perf_counter() - start, 3))
+        # Nothing matched is a failure too, scripted rollout must not treat it as done
+        return 1 if failed or not addresses else 0
+    except KeyboardInterrupt:
+        emit('error', error='interrupted')
+        return 130
+    except Exception as e:
+        emit('error', error=f'{e}')
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
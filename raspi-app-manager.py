@@ -2,38 +2,47 @@
 import os
 import sys
 import json
+import time
 import ipaddress
 import threading
 import collections
-from PySide.QtGui import *
-from PySide.QtCore import *
-from typing import Optional, List, Dict, Callable, Union, Any, ClassVar
-
-from raspi_io.utility import scan_server
-from raspi_io.app_manager import AppState
-from raspi_io.core import RaspiMsgDecodeError
-from raspi_io import AppManager, Query, Wireless, RaspiException
-
-import version
-import resources_rc
-from operate import *
-from configure import *
-
-from framework.core.uimailbox import *
-from framework.core.threading import ThreadLockAndDataWrap
-from framework.core.datatype import DynamicObject, DynamicObjectEncodeError, DynamicObjectDecodeError
-
-from framework.protocol.upgrade import GogsSoftwareReleaseDesc
-
-from framework.misc.windpi import scale_x, scale_size
-from framework.misc.settings import UiLogMessage, JsonSettingsDecodeError
-from framework.misc.parallel import BackgroundOperateLauncher, ConcurrentLauncher
-
-from framework.gui.msgbox import *
-from framework.gui.checkbox import CheckBoxDelegate
-from framework.gui.widget import TableWidget, LogMessageWidget
-from framework.gui.dialog import showFileImportDialog, showFileExportDialog, \
-    MultiGroupJsonSettingsDialog, ProgressDialog, JsonSettingDialog
+from typing import Optional, List, Set, Callable, Union, Any, ClassVar, Iterator
+from startup import startup_profiler
+
+# Dialogs, upgrade protocol, scanner, inventory, release cache and qt resources are imported when first used
+with startup_profiler.measure('import qt'):
+    from PySide.QtGui import *
+    from PySide.QtCore import *
+
+with startup_profiler.measure('import raspi_io'):
+    from raspi_io.utility import scan_server
+    from raspi_io.app_manager import AppState
+    from raspi_io.core import RaspiMsgDecodeError
+    from raspi_io import AppManager, Query, Wireless, RaspiException
+
+with startup_profiler.measure('import framework'):
+    from framework.core.uimailbox import *
+    from framework.core.threading import ThreadLockAndDataWrap
+    from framework.core.datatype import DynamicObjectEncodeError, DynamicObjectDecodeError
+
+    from framework.misc.windpi import scale_x, scale_size
+    from framework.misc.settings import UiLogMessage, JsonSettingsDecodeError
+
+    from framework.gui.msgbox import *
+
+with startup_profiler.measure('import app'):
+    import version
+    from operate import *
+    from configure import *
+    from pool import connection_pool
+    from uibus import UiUpdateBus
+    from logview import LogView
+    from device_table import DeviceTableView
+    from payload import SharedPackage
+    from scheduler import OperateScheduler
+    from shaper import bandwidth_shaper
+    from monitor import DeviceMonitor
+    from pipeline import OperatePipeline, PipelineStage
 
 
 AppDescFormat = "App Description(*.json)"
@@ -41,24 +50,34 @@ Device = collections.namedtuple('Device', ['row', 'address'])
 
 
 class RaspberryPiUpdateTools(QMainWindow):
-    signalLogging = Signal(UiLogMessage)
-    signalOperateLogging = Signal(UiLogMessage, int)
-
-    signalMarkDeviceAsIdle = Signal(Device)
-    signalFoundDevice = Signal(RaspberryPiInfo)
-    signalUpdateProgress = Signal(int, str, object)
-
-    signalUpdateIOSVersion = Signal(int, object)
-    signalUpdateAppVersion = Signal(int, object, str)
-
     ACTION_GROUP = collections.namedtuple('Action', ['SCAN', 'NETWORK', 'USER_APP', 'IOS_APP', 'SYSTEM'])(*range(5))
     COLUMN = collections.namedtuple(
         'Column', ['SEL', 'REV', 'SN', 'ETH', 'WLAN', 'IOS_VER', 'APP_VER', 'APP_STATE', 'OPERATE_RESULT']
     )(*range(9))
 
+    # Max lines display in log window, all lines are written to log file
+    LOG_MAX_LINES = 5000
+    # Max in-flight device probes while scanning
+    SCAN_CONCURRENCY = 64
+    # Incremental scan only reprobe device last probed before SCAN_TTL seconds
+    SCAN_TTL = 300.0
+    # Max devices installing at same time in deploy pipeline
+    DEPLOY_CONCURRENCY = 8
+
     def __init__(self):
         self.app_config = None
+        self.skip_identical_update = False
+        self.delta_update = False
+        self.compress_transfer = False
         self.device_state = ThreadLockAndDataWrap(dict())
+        # Incremental scan start time, addresses answered scan and addresses failed direct probe
+        self.scan_start = None
+        self.scan_seen = set()
+        self.scan_failed = set()
+        self.scheduler = OperateScheduler()
+        self._scanner = None
+        self._inventory = None
+        self._ui_progress = None
         super(RaspberryPiUpdateTools, self).__init__()
         self._initUi()
         self._initMenu()
@@ -69,10 +88,11 @@ class RaspberryPiUpdateTools(QMainWindow):
     def _initUi(self):
         self.ui_mail = UiMailBox(self)
         self.ui_table_content_menu = QMenu(self)
-        self.ui_logging = LogMessageWidget('raspi-app-manager.log', parent=self)
-        self.ui_progress = ProgressDialog(self, closeable=False, max_width=scale_x(400))
+        self.ui_logging = LogView('raspi-app-manager.log', max_lines=self.LOG_MAX_LINES, parent=self)
+        self.ui_scheduler_state = QLabel(self)
+        self.statusBar().addPermanentWidget(self.ui_scheduler_state)
 
-        self.ui_table = TableWidget(len(self.COLUMN), disable_custom_content_menu=True, parent=self)
+        self.ui_table = DeviceTableView(parent=self)
         self.ui_table.setColumnHeader((
             self.tr("Sel"),
             self.tr("Revision"), self.tr("Serial Number"), self.tr("Ethernet"), self.tr("Wireless"),
@@ -94,7 +114,7 @@ class RaspberryPiUpdateTools(QMainWindow):
         self.menu_bar = QMenuBar(self)
         self.setMenuBar(self.menu_bar)
 
-        sub_menu = collections.namedtuple('menu', ['name', 'slot', 'shortcut'])
+        sub_menu = collections.namedtuple('menu', ['name', 'slot', 'shortcut', 'checkable'], defaults=(False,))
         separator = sub_menu(name='separator', slot=None, shortcut=None)
 
         for menu, actions in {
@@ -103,7 +123,7 @@ class RaspberryPiUpdateTools(QMainWindow):
                 sub_menu(name=self.tr("Save App Description Template"), shortcut='Ctrl+S',
                          slot=self.slotSaveAppDescTemplate),
                 separator,
-                sub_menu(name=self.tr('Quit'), shortcut='Ctrl+Q', slot=lambda: sys.exit())
+                sub_menu(name=self.tr('Quit'), shortcut='Ctrl+Q', slot=self.close)
             ],
 
             sub_menu(name=self.tr("View"), slot=None, shortcut=None): [
@@ -111,16 +131,22 @@ class RaspberryPiUpdateTools(QMainWindow):
                          shortcut=None, slot=lambda: self.ui_logging.setVisible(True)),
                 sub_menu(name=self.tr('Hidden Log Window'),
                          shortcut=None, slot=lambda: self.ui_logging.setHidden(True)),
+                separator,
+                sub_menu(name=self.tr('Live Monitor'), shortcut=None, slot=self.slotLiveMonitor, checkable=True),
+                sub_menu(name=self.tr('Operate Statistics'), shortcut='Ctrl+T', slot=self.slotShowOperateStatistics),
             ],
 
             sub_menu(name=self.tr('RPi'), slot=None, shortcut=None): [
                 sub_menu(name=self.tr('Scan'), shortcut='F5', slot=self.slotScan),
+                sub_menu(name=self.tr('Incremental Scan'), shortcut='Shift+F5', slot=self.slotIncrementalScan),
                 sub_menu(name=self.tr('Reboot'), shortcut='Alt+F9', slot=self.slotRebootSystem),
                 sub_menu(name=self.tr('Update IO Server'), shortcut='Alt+F2', slot=self.slotUpdateIOServer),
                 sub_menu(name=self.tr('Manual Add Raspi'), shortcut='Alt+F3', slot=self.slotManualAddRaspberryPi),
+                sub_menu(name=self.tr('Bandwidth Limit'), shortcut=None, slot=self.slotBandwidthLimit),
                 separator,
                 sub_menu(name=self.tr('Install User App'), shortcut='Ctrl+Alt+I', slot=self.slotInstallUserApp),
                 sub_menu(name=self.tr('Uninstall User App'), shortcut='Ctrl+Alt+U', slot=self.slotUninstallUserApp),
+                sub_menu(name=self.tr('Deploy User App'), shortcut='Ctrl+Alt+D', slot=self.slotDeployUserApp),
             ],
 
             sub_menu(name=self.tr('Wireless'), slot=None, shortcut=None): [
@@ -134,6 +160,11 @@ class RaspberryPiUpdateTools(QMainWindow):
             sub_menu(name=self.tr('App'), slot=None, shortcut=None): [
                 sub_menu(name=self.tr('Local Update'), shortcut=None, slot=self.slotLocalUpdate),
                 sub_menu(name=self.tr('Online Update'), shortcut=None, slot=self.slotOnlineUpdate),
+                sub_menu(name=self.tr('Skip Identical Update'), shortcut=None,
+                         slot=self.slotSkipIdenticalUpdate, checkable=True),
+                sub_menu(name=self.tr('Delta Update'), shortcut=None, slot=self.slotDeltaUpdate, checkable=True),
+                sub_menu(name=self.tr('Compress Transfer'), shortcut=None,
+                         slot=self.slotCompressTransfer, checkable=True),
                 separator,
                 sub_menu(name=self.tr('Upload App Configures'), shortcut=None, slot=None),
                 sub_menu(name=self.tr('Download App Configure'), shortcut=None, slot=None),
@@ -151,6 +182,7 @@ class RaspberryPiUpdateTools(QMainWindow):
                     continue
 
                 action = QAction(child.name, self)
+                action.setCheckable(child.checkable)
 
                 if callable(child.slot):
                     action.triggered.connect(child.slot)
@@ -168,30 +200,89 @@ class RaspberryPiUpdateTools(QMainWindow):
         self.ui_table.setColumnStretchFactor((0.02, 0.08, 0.16, 0.135, 0.135, 0.08, 0.08, 0.09))
 
         self.ui_table.setColumnMaxWidth(self.COLUMN.SEL, scale_x(40))
-        self.ui_table.setItemDelegateForColumn(
-            self.COLUMN.SEL, CheckBoxDelegate(stylesheet=DynamicObject(sizeFactor=2.0), parent=self)
-        )
 
-        self.setWindowIcon(QPixmap(":ico/ico/raspi.ico"))
         self.setMinimumSize(QSize(*scale_size((800, 600))))
         self.setWindowTitle(self.tr("Raspberry Pi App Manager {}".format(version.s_version)))
 
     def _initSignalAndSlots(self):
-        self.signalLogging.connect(self.slotDisplayLogging)
-        self.signalOperateLogging.connect(self.slotDisplayLogging)
+        # Worker updates are coalesced and applied in batch on gui thread in posted order,
+        # keyed updates of same row only latest applied
+        self.update_bus = UiUpdateBus(interval=50, parent=self)
+
+        self.signalLogging = self.update_bus.signal(self.slotDisplayLogging)
+        self.signalOperateLogging = self.update_bus.signal(self.slotDisplayLogging)
 
-        self.signalUpdateProgress.connect(self.slotUpdateProcess)
+        self.signalUpdateProgress = self.update_bus.signal(self.slotUpdateProcess, key=lambda row, *_: row)
 
-        self.signalFoundDevice.connect(self.slotFoundNewRaspberryPi)
-        self.signalMarkDeviceAsIdle.connect(self.slotMarkDeviceAsIdle)
+        self.signalFoundDevice = self.update_bus.signal(self.slotFoundNewRaspberryPi, key=lambda info: info.sn)
+        self.signalMarkDeviceAsIdle = self.update_bus.signal(self.slotMarkDeviceAsIdle, key=lambda device: device.row)
 
-        self.signalUpdateAppVersion.connect(self.slotUpdateAppVersion)
-        self.signalUpdateIOSVersion.connect(self.slotUpdateIOSVersion)
+        self.signalUpdateAppVersion = self.update_bus.signal(self.slotUpdateAppVersion, key=lambda row, *_: row)
+        self.signalUpdateIOSVersion = self.update_bus.signal(self.slotUpdateIOSVersion, key=lambda row, *_: row)
+        self.signalDeviceChanged = self.update_bus.signal(self.slotDeviceChanged)
+        # Keyed, must be applied after found devices posted before it
+        self.signalScanFinished = self.update_bus.signal(self.slotMarkStaleDevices, key=lambda *_: 'scan')
 
         self.ui_table.customContextMenuRequested.connect(self.slotCustomTableContentMenu)
 
     def _initThreadAndTimer(self):
-        pass
+        self.monitor = DeviceMonitor(
+            self.signalDeviceChanged.emit, self.getCurrentAppName,
+            busy=lambda address: bool(self.device_state.data.get(address)),
+            error=lambda address, e: self.signalLogging.emit(
+                UiLogMessage.genDefaultErrorMessage(f'Monitor {address!r} offline: {e}')
+            )
+        )
+
+        self.scheduler_timer = QTimer(self)
+        self.scheduler_timer.timeout.connect(self.slotUpdateSchedulerState)
+        self.scheduler_timer.start(500)
+
+        # Show last known devices immediately, then revalidate them in background
+        QTimer.singleShot(0, self.slotLoadInventory)
+        QTimer.singleShot(0, self.slotStartupFinished)
+
+    @property
+    def ui_progress(self):
+        if self._ui_progress is None:
+            from framework.gui.dialog import ProgressDialog
+            self._ui_progress = ProgressDialog(self, closeable=False, max_width=scale_x(400))
+
+        return self._ui_progress
+
+    @property
+    def scanner(self):
+        if self._scanner is None:
+            from scanner import FleetScanner
+            self._scanner = FleetScanner(
+                self.fetchRaspberryPiInfo, self.signalFoundDevice.emit,
+                error=self.callbackFetchRaspberryPiInfoError, finished=self.callbackScanFinished,
+                concurrency=self.SCAN_CONCURRENCY
+            )
+
+        return self._scanner
+
+    @property
+    def inventory(self):
+        if self._inventory is None:
+            from inventory import DeviceInventory
+            self._inventory = DeviceInventory(os.path.join(AppDataDir, 'inventory.db'))
+
+        return self._inventory
+
+    def slotStartupFinished(self):
+        # Qt resources are registered after window shown, resource paths are only valid from here
+        with startup_profiler.measure('load resources'):
+            import resources_rc  # noqa: F401, register qt resources
+
+        self.setWindowIcon(QPixmap(":ico/ico/raspi.ico"))
+
+        startup_profiler.mark('first event loop')
+        startup_profiler.save(os.path.join(AppDataDir, 'startup.log'), version.s_version)
+        self.signalLogging.emit(UiLogMessage.genDefaultDebugMessage(f'Startup: {startup_profiler.report()}'))
+
+    def getCurrentAppName(self) -> str:
+        return self.app_config.app_name if isinstance(self.app_config, RaspberryPiSoftwareDescription) else ''
 
     def getCurrentRowSN(self, row: int) -> str:
         return self.ui_table.getItemData(row, self.COLUMN.SN) if 0 <= row < self.ui_table.rowCount() else ""
@@ -204,6 +295,7 @@ class RaspberryPiUpdateTools(QMainWindow):
         return self.ui_table.getItemProperty(device.row, self.COLUMN.SEL)
 
     def markDeviceAsBusy(self, operate_name: str, operate_devices: List[Device]):
+        # Must be called before operate submitted, so its idle mark and result always come after
         for row, address in operate_devices:
             self.device_state.data[address] = operate_name
             self.ui_table.frozenItem(row, self.COLUMN.SEL, True)
@@ -235,12 +327,40 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not devices:
             return
 
-        update_package = showFileImportDialog(self, fmt="Tar File (*.tar)", title=title)
-        if not os.path.isfile(update_package):
+        # Only user app knows exe name, compare it with device app exe md5
+        exe_name = ""
+        if isinstance(self.app_config, RaspberryPiSoftwareDescription) and app_name == self.app_config.app_name:
+            exe_name = self.app_config.exe_name
+
+        def loaded(update_package: SharedPackage):
+            delta_exe = exe_name if self.delta_update else ""
+            skip_md5 = update_package.member_md5(exe_name) if exe_name and self.skip_identical_update else ""
+            if exe_name and self.skip_identical_update and not skip_md5:
+                msg = f'{exe_name!r} ' + self.tr("not found in package, skip identical disabled")
+                self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(msg))
+
+            args = [(row_, address, app_name, update_package, skip_md5, delta_exe, self.compress_transfer)
+                    for row_, address in devices]
+            self.createConcurrentOperateThread(tag, devices, LocalUpdate, args, callback)
+
+        self.loadPackage(title, loaded, exe_name)
+
+    def loadPackage(self, title: str, loaded: Callable[[SharedPackage], None], exe_name: str = ""):
+        """Select package, package is read and hashed in background, loaded(package) is called on gui thread
+
+        :param title: file dialog title
+        :param loaded: package loaded callback
+        :param exe_name: app exe name, its md5 inside package is computed in background too
+        :return:
+        """
+        from framework.gui.dialog import showFileImportDialog
+        path = showFileImportDialog(self, fmt="Tar File (*.tar)", title=title)
+        if not os.path.isfile(path):
             return
 
-        args = [(row, address, app_name, update_package) for row, address in devices]
-        self.createConcurrentOperateThread(tag, devices, LocalUpdate, args, callback)
+        th = threading.Thread(target=self.threadLoadPackage, kwargs=dict(path=path, loaded=loaded, exe_name=exe_name))
+        th.setDaemon(True)
+        th.start()
 
     def createConcurrentOperateThread(self, operate_name: str, operate_devices: List[Device],
                                       operate_cls: ClassVar, operate_args: list, callback: Callable) -> bool:
@@ -251,14 +371,12 @@ class RaspberryPiUpdateTools(QMainWindow):
         self.ui_progress.setRange(0, operate_cnt + 1)
         operate = operate_cls(self.signalOperateLogging.emit, callback)
 
-        # Limit max works number
-        max_workers = operate_cnt if operate_cnt <= 32 else 32
-        launcher = ConcurrentLauncher(operate, max_workers=max_workers)
-        launcher.run(operate_args)
-
         # Disable currently operating device
         self.markDeviceAsBusy(operate_name, operate_devices)
 
+        # Concurrency is limited by scheduler per operate class
+        self.scheduler.submit(operate, operate_args)
+
         return True
 
     def checkApp(self):
@@ -271,13 +389,33 @@ class RaspberryPiUpdateTools(QMainWindow):
         if any(self.device_state.data.values()):
             return showMessageBox(self, MB_TYPE_WARN, self.tr("Please wait device operating finished"))
 
+        if self.scanner.is_running():
+            return showMessageBox(self, MB_TYPE_WARN, self.tr("Please wait scan finished"))
+
+        self.scan_start = None
         self.ui_table.setRowCount(0)
-        th = threading.Thread(target=self.threadScanRaspberryPi)
-        th.setDaemon(True)
-        th.start()
+        self.monitor.clear()
+        self.scanner.scan(scan_server(timeout=0.05))
+
+    def slotIncrementalScan(self, ttl: Optional[float] = None):
+        if any(self.device_state.data.values()):
+            return showMessageBox(self, MB_TYPE_WARN, self.tr("Please wait device operating finished"))
+
+        if self.scanner.is_running():
+            return showMessageBox(self, MB_TYPE_WARN, self.tr("Please wait scan finished"))
+
+        ttl = self.SCAN_TTL if not isinstance(ttl, (int, float)) or isinstance(ttl, bool) else ttl
+        self.scan_start = time.monotonic()
+        self.scan_seen = set()
+        self.scan_failed = set()
+
+        known = self.ui_table.store.probe_times()
+        fresh = {address for address, probed in known.items() if self.scan_start - probed < ttl}
+        self.scanner.scan(self.generateIncrementalScanAddress(set(known), fresh, self.scan_seen))
 
     def slotLoadAppDesc(self):
         title = self.tr("Please select app description file")
+        from framework.gui.dialog import showFileImportDialog
         app_desc = showFileImportDialog(self, fmt=AppDescFormat, title=title)
         if not os.path.isfile(app_desc):
             return
@@ -291,12 +429,14 @@ class RaspberryPiUpdateTools(QMainWindow):
             msg = self.tr("Load app description file success") + f": {app}"
             self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(msg))
             self.setWindowTitle(self.tr("Raspberry Pi App Manager") + f' {version.s_version}' + f' ({app})')
-            self.slotScan()
+            # App changed, reprobe app state of all devices but keep table
+            self.slotIncrementalScan(ttl=0)
         except (json.JSONDecodeError, JsonSettingsDecodeError, DynamicObjectDecodeError, DynamicObjectEncodeError) as e:
             return showMessageBox(self, MB_TYPE_ERR, f'{e}', self.tr("Load App Description Configure"))
 
     def slotSaveAppDescTemplate(self):
         title = self.tr("Please select 'App Description' file template save path")
+        from framework.gui.dialog import showFileExportDialog
         path = showFileExportDialog(self, fmt=AppDescFormat, title=title)
         if not path:
             return
@@ -325,15 +465,16 @@ class RaspberryPiUpdateTools(QMainWindow):
         except ValueError as e:
             return showMessageBox(self, MB_TYPE_ERR, f'{e}', self.tr('Input Address error'))
 
-        if address in self.ui_table.getColumnData(self.COLUMN.ETH) + self.ui_table.getColumnData(self.COLUMN.WLAN):
+        if self.ui_table.store.index.row_of_address(address) is not None:
             return showMessageBox(self, MB_TYPE_WARN,
                                   self.tr("Raspberry Pi") + f": {address!r} " + self.tr("already exist"))
 
+        if self.scanner.is_running():
+            return showMessageBox(self, MB_TYPE_WARN, self.tr("Please wait scan finished"))
+
         try:
-            Query(address)
-            th = threading.Thread(target=self.threadFetchRaspberryPiInfo, kwargs=dict(address=address))
-            th.setDaemon(True)
-            th.start()
+            with connection_pool.connection(Query, address):
+                self.scanner.scan([address])
         except RaspiException as e:
             return showMessageBox(self, MB_TYPE_ERR, self.tr("Add failed") + f': {e}', self.tr('Add RPI Failed'))
 
@@ -347,20 +488,74 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not isinstance(device_info, RaspberryPiInfo):
             return
 
-        sn_list = self.ui_table.getColumnData(self.COLUMN.SN)
+        # New device append to table, exist device(same sn) reload row and reset operate result
+        self.ui_table.setDevice(device_info)
+        self.monitor.add(device_info.ethernet or device_info.wireless, dict(
+            online=True, ios_version=device_info.ios_version, app=device_info.app_state,
+            app_version=device_info.app_state.get("version"), app_state=device_info.app_state.get("state")
+        ))
 
-        if device_info.sn not in sn_list:
-            row = self.ui_table.rowCount()
-            self.ui_table.addRow(device_info.format_as_list(), [device_info])
+    def slotLoadInventory(self):
+        devices = self.inventory.load()
+        for device_info in devices:
+            # Never probed in this session, older than any ttl so incremental scan will reprobe it
+            row = self.ui_table.setDevice(device_info, probed=float('-inf'))
+            self.slotUpdateProcess(row, self.tr("Cached"), Qt.gray)
+
+        if devices:
+            self.slotIncrementalScan()
+
+    def saveInventory(self):
+        # Stale device failed a direct probe, it's removed from inventory
+        self.inventory.save([record.info for record in self.ui_table.store if not record.stale],
+                            [record.info.sn for record in self.ui_table.store if record.stale])
+
+    def closeEvent(self, event: QCloseEvent):
+        self.saveInventory()
+        super(RaspberryPiUpdateTools, self).closeEvent(event)
+
+    def slotMarkStaleDevices(self, statistics: 'ScanStatistics'):
+        if self.scan_start is not None:
+            # Only device failed a direct probe in this scan is stale, a missed broadcast is not enough
+            for row, record in enumerate(self.ui_table.store):
+                if record.probed < self.scan_start and self.scan_failed.intersection(record.addresses):
+                    record.stale = True
+                    self.slotUpdateProcess(row, self.tr("Stale"), Qt.gray)
+
+        self.saveInventory()
+
+    def slotShowOperateStatistics(self):
+        from metrics import operate_metrics
+        from metrics_dialog import OperateMetricsDialog
+        OperateMetricsDialog(operate_metrics, parent=self).exec_()
+
+    def slotLiveMonitor(self, checked: bool):
+        if checked:
+            self.monitor.start()
         else:
-            row = sn_list.index(device_info.sn)
-            self.slotUpdateProcess(row, "", QColor(Qt.white))
-            self.ui_table.setRowData(row, device_info.format_as_list())
+            self.monitor.stop()
+
+    def slotDeviceChanged(self, address: str, changes: dict):
+        row = self.ui_table.store.index.row_of_address(address)
+        if row is None or self.device_state.data.get(address):
+            return
 
-        self.ui_table.frozenRow(row, True)
-        self.ui_table.frozenItem(row, self.COLUMN.SEL, False)
-        self.ui_table.setRowAlignment(row, Qt.AlignCenter)
-        self.ui_table.openPersistentEditor(self.ui_table.item(row, self.COLUMN.SEL))
+        if "online" in changes:
+            online = changes["online"]
+            self.slotUpdateProcess(row, self.tr("Online") if online else self.tr("Offline"),
+                                   Qt.green if online else Qt.gray)
+
+        if "ios_version" in changes:
+            self.slotUpdateIOSVersion(row, changes["ios_version"])
+
+        if "app" in changes:
+            self.getCurrentDeviceInfo(Device(row, address)).app_state = changes["app"] or dict()
+
+        if "app_version" in changes or "app_state" in changes:
+            self.ui_table.setItemData(row, self.COLUMN.APP_VER, str(changes.get(
+                "app_version", self.ui_table.getItemData(row, self.COLUMN.APP_VER)) or ""))
+            self.ui_table.setItemData(row, self.COLUMN.APP_STATE, changes.get(
+                "app_state", self.ui_table.getItemData(row, self.COLUMN.APP_STATE)) or "")
 
     def slotDisplayLogging(self, msg: UiLogMessage, row: Optional[int] = None):
         if row is not None:
@@ -385,19 +580,10 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not devices:
             return
 
-        # Ask input network info
-        network = MultiGroupJsonSettingsDialog.getData(UiJoinNetwork.default(), dict(), parent=self)
+        network = self.getJoinNetwork()
         if not network:
             return
 
-        # Check network info
-        if any([not network.get(x) for x in UiJoinNetwork.REQUIRED_OPTIONS]):
-            names = ", ".join([UiJoinNetwork.default().dict.get(x).get('name')
-                               for x in UiJoinNetwork.REQUIRED_OPTIONS])
-            return showMessageBox(self, MB_TYPE_WARN, f'{names!r} ' + self.tr("are required"))
-
-        network['scan_ssid'] = int(network['scan_ssid'])
-
         def callback(result: Union[bool, str], row_: int, address: str, *_args):
             result = result if isinstance(result, bool) else False
             self.callbackOperatingFinished(self.tr("Join") + f' {network["ssid"]!r}', result, row_, address)
@@ -406,6 +592,23 @@ class RaspberryPiUpdateTools(QMainWindow):
         args = [(row, address, network) for row, address in devices]
         self.createConcurrentOperateThread(self.tr("Join Network"), devices, JoinWirelessNetwork, args, callback)
 
+    def getJoinNetwork(self) -> dict:
+        # Ask input network info
+        from framework.gui.dialog import MultiGroupJsonSettingsDialog
+        network = MultiGroupJsonSettingsDialog.getData(UiJoinNetwork.default(), dict(), parent=self)
+        if not network:
+            return dict()
+
+        # Check network info
+        if any([not network.get(x) for x in UiJoinNetwork.REQUIRED_OPTIONS]):
+            names = ", ".join([UiJoinNetwork.default().dict.get(x).get('name')
+                               for x in UiJoinNetwork.REQUIRED_OPTIONS])
+            showMessageBox(self, MB_TYPE_WARN, f'{names!r} ' + self.tr("are required"))
+            return dict()
+
+        network['scan_ssid'] = int(network['scan_ssid'])
+        return network
+
     def slotLeaveWireless(self, row: Optional[int] = None):
         devices = self.getCurrentOperateDevice(row)
         if not devices:
@@ -414,11 +617,10 @@ class RaspberryPiUpdateTools(QMainWindow):
         if len(devices) == 1:
             # Single device choose from device network list
             try:
-                wireless = Wireless(devices[0].address)
-                networks = wireless.get_networks()
+                networks = connection_pool.call(Wireless, devices[0].address, 'get_networks')
 
                 if not networks:
-                    self.signalUpdateProgress.emit(row, self.tr('Network is empty'), Qt.green)
+                    self.signalUpdateProgress.emit(devices[0].row, self.tr('Network is empty'), Qt.green)
                     return
 
                 network, selected = QInputDialog.getItem(
@@ -455,6 +657,7 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not devices:
             return
 
+        from framework.gui.dialog import JsonSettingDialog
         try:
             app_state = AppState(**self.getCurrentDeviceInfo(devices[0]).app_state)
             app_state.size /= 1024 * 1024
@@ -474,16 +677,14 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not devices:
             return
 
-        title = self.tr("Please select will install app package")
-        package = showFileImportDialog(self, fmt="Tar File (*.tar)", title=title)
-        if not os.path.isfile(package):
-            return
-
         desc = self.app_config
-        self.createConcurrentOperateThread(
-            self.tr("Installing App"), devices,
-            InstallUserApp, [(row, address, package, desc.dict) for row, address in devices], self.callbackInstallApp
-        )
+
+        def loaded(package: SharedPackage):
+            args = [(row_, address, package, desc.dict, self.compress_transfer) for row_, address in devices]
+            self.createConcurrentOperateThread(self.tr("Installing App"), devices, InstallUserApp, args,
+                                               self.callbackInstallApp)
+
+        self.loadPackage(self.tr("Please select will install app package"), loaded, desc.exe_name)
 
     def slotUninstallUserApp(self, row: Optional[int] = None):
         if not self.checkApp():
@@ -499,6 +700,77 @@ class RaspberryPiUpdateTools(QMainWindow):
             UninstallUserApp, [(row, address, app_name) for row, address in devices], self.callbackUninstallApp
         )
 
+    def slotDeployUserApp(self, row: Optional[int] = None):
+        if not self.checkApp():
+            return
+
+        devices = self.getCurrentOperateDevice(row)
+        if not devices:
+            return
+
+        network = dict()
+        if showQuestionBox(self, self.tr("Join wireless network after app installed?"), self.tr("Deploy User App")):
+            network = self.getJoinNetwork()
+            if not network:
+                return
+
+        desc = self.app_config
+        self.loadPackage(self.tr("Please select will install app package"),
+                         lambda package: self.startDeployPipeline(devices, package, network), desc.exe_name)
+
+    def startDeployPipeline(self, devices: List[Device], package: SharedPackage, network: dict):
+        # Install -> (join network) -> reboot -> verify, each device goes to next stage as soon as it passed
+        desc = self.app_config
+        verify = package.verifier(desc.exe_name)
+        stages = [PipelineStage(self.tr("Install App"), InstallUserApp, (package, desc.dict, self.compress_transfer),
+                                concurrency=self.DEPLOY_CONCURRENCY, verify=verify)]
+        if network:
+            stages.append(PipelineStage(self.tr("Join Network"), JoinWirelessNetwork, (network,)))
+
+        stages.append(PipelineStage(self.tr("Reboot"), Reboot, concurrency=self.ui_table.rowCount()))
+        stages.append(PipelineStage(self.tr("Verify App"), GetAppState, (desc.app_name,), verify=verify))
+
+        def progress(stage: PipelineStage, passed: bool, result: Any, row_: int, _address: str):
+            if passed and stage.operate is InstallUserApp:
+                self.signalUpdateAppVersion.emit(row_, result.get("version"), self.tr("Rebooting"))
+            elif passed and stage.operate is GetAppState:
+                self.signalUpdateAppVersion.emit(row_, result.get("version"), result.get("state"))
+
+            result_str = self.tr('Success') if passed else self.tr("Failed") + f': {result}'
+            self.signalOperateLogging.emit(UiLogMessage.genDefaultInfoMessage(f'{stage.name} {result_str}'), row_)
+
+        def finished(success: bool, stage: Optional[PipelineStage], row_: int, address: str):
+            operate = self.tr("Deploy") if success else f'{self.tr("Deploy")} ({stage.name})'
+            self.callbackOperatingFinished(operate, success, row_, address)
+
+        pipeline = OperatePipeline(stages, self.scheduler.submit, self.signalOperateLogging.emit, progress, finished)
+        self.ui_progress.setRange(0, len(devices) + 1)
+        self.markDeviceAsBusy(self.tr("Deploying"), devices)
+        pipeline.start(devices)
+
+    def slotSkipIdenticalUpdate(self, checked: bool):
+        self.skip_identical_update = checked
+
+    def slotDeltaUpdate(self, checked: bool):
+        self.delta_update = checked
+
+    def slotCompressTransfer(self, checked: bool):
+        self.compress_transfer = checked
+
+    def slotBandwidthLimit(self):
+        rate, inputted = QInputDialog.getInt(
+            self, self.tr("Bandwidth Limit"),
+            self.tr("Average total transfer rate of all devices (MB/s, 0 is unlimited)"),
+            int(bandwidth_shaper.rate / 1024 / 1024), 0, 10000
+        )
+
+        if not inputted:
+            return
+
+        bandwidth_shaper.rate = rate * 1024 * 1024
+        msg = self.tr("Bandwidth limit") + f': {format_rate(bandwidth_shaper.rate) if rate else self.tr("unlimited")}'
+        self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(msg))
+
     def slotBackupWireless(self, row: Optional[int] = None):
         pass
 
@@ -539,21 +811,17 @@ class RaspberryPiUpdateTools(QMainWindow):
         for row, _ in devices:
             self.signalUpdateProgress.emit(row, self.tr("Fetching Update"), Qt.yellow)
 
-        try:
-            auth = auth.dict
-            repo = auth.pop('repo')
-            manager = AppManager(devices[0].address, timeout=300)
-            th = threading.Thread(target=self.threadFetchUpdate,
-                                  kwargs=dict(repo=repo, auth=auth, manager=manager, devices=devices))
-            th.setDaemon(True)
-            th.start()
-        except RaspiException as e:
-            return showMessageBox(self, MB_TYPE_ERR, f"Fetch online update failed: {e}", title)
+        auth = auth.dict
+        repo = auth.pop('repo')
+        th = threading.Thread(target=self.threadFetchUpdate, kwargs=dict(repo=repo, auth=auth, devices=devices))
+        th.setDaemon(True)
+        th.start()
 
     def slotCustomTableContentMenu(self, pos: QPoint):
         content_menu = QMenu(self)
-        item = self.ui_table.itemAt(pos)
-        if isinstance(item, QTableWidgetItem):
+        item = self.ui_table.indexAt(pos)
+        item = item if item.isValid() else None
+        if item is not None:
             device = self.getCurrentRowDevice(item.row())
             if self.device_state.data.get(device.address):
                 return
@@ -599,6 +867,14 @@ class RaspberryPiUpdateTools(QMainWindow):
 
         content_menu.popup(self.ui_table.viewport().mapToGlobal(pos))
 
+    def slotUpdateSchedulerState(self):
+        state = [f'{name}: {x.running}/{x.limit} ' + self.tr("running") + f', {x.queued} ' + self.tr("queued") +
+                 f', {x.throughput:.1f}/s' for name, x in self.scheduler.statistics().items() if x.running or x.queued]
+        if bandwidth_shaper.waiting:
+            state.append(f'{bandwidth_shaper.waiting} ' + self.tr("waiting bandwidth"))
+
+        self.ui_scheduler_state.setText(" | ".join(state))
+
     def slotUpdateIOSVersion(self, row: int, ver: Union[str, float]):
         self.ui_table.setItemData(row, self.COLUMN.IOS_VER, str(ver))
 
@@ -608,20 +884,31 @@ class RaspberryPiUpdateTools(QMainWindow):
         # App uninstalled remote app state info form device info
         if not str(ver) or state == self.tr("Uninstall"):
             device_info = self.ui_table.getItemProperty(row, self.COLUMN.SEL)
-            device_info.app_state = dict()
-            self.ui_table.setItemProperty(row, self.COLUMN.SEL, device_info)
+            if isinstance(device_info, RaspberryPiInfo):
+                device_info.app_state = dict()
+                self.ui_table.setItemProperty(row, self.COLUMN.SEL, device_info)
 
     def slotUpdateProcess(self, row: int, process: str, color: Union[Qt.GlobalColor, QColor]):
         self.ui_table.setItemData(row, self.COLUMN.OPERATE_RESULT, process)
-        self.ui_table.setItemBackground(row, self.COLUMN.OPERATE_RESULT, QBrush(color))
+        self.ui_table.setItemBackground(row, self.COLUMN.OPERATE_RESULT, color)
+
+    @staticmethod
+    def formatTransfer(result: dict) -> str:
+        if not result.get("transfer_rate"):
+            return ""
+
+        attempts = result.get("transfer_attempts", 1)
+        return f' ({format_rate(result["transfer_rate"])}' + (f', {attempts} attempts)' if attempts > 1 else ')')
 
     def callbackUpdate(self, tag: str, result: Any, row: int, address: str, *_args):
         if not isinstance(result, dict):
             msg = f'{tag} ' + self.tr("failed") + f" : {result}"
             self.signalOperateLogging.emit(UiLogMessage.genDefaultErrorMessage(msg), row)
             self.signalUpdateProgress.emit(row, f'{tag} ' + self.tr("Failed"), Qt.red)
+        elif result.get("skipped"):
+            self.signalUpdateProgress.emit(row, f'{tag} ' + self.tr("Skipped (Up To Date)"), Qt.green)
         else:
-            self.signalUpdateProgress.emit(row, f'{tag} ' + self.tr("Success"), Qt.green)
+            self.signalUpdateProgress.emit(row, f'{tag} ' + self.tr("Success") + self.formatTransfer(result), Qt.green)
             self.signalUpdateAppVersion.emit(row, result.get("version"), self.tr("Rebooting"))
 
         self.signalMarkDeviceAsIdle.emit(Device(row, address))
@@ -633,7 +920,7 @@ class RaspberryPiUpdateTools(QMainWindow):
             self.signalUpdateProgress.emit(row, self.tr("App Install Failed"), Qt.red)
         else:
             self.signalUpdateAppVersion.emit(row, result.get("version"), self.tr("Rebooting"))
-            self.signalUpdateProgress.emit(row, self.tr("App Install Success"), Qt.green)
+            self.signalUpdateProgress.emit(row, self.tr("App Install Success") + self.formatTransfer(result), Qt.green)
 
         self.signalMarkDeviceAsIdle.emit(Device(row, address))
 
@@ -653,7 +940,7 @@ class RaspberryPiUpdateTools(QMainWindow):
             self.signalUpdateProgress.emit(row, self.tr("IOS Update Failed"), Qt.red)
         else:
             self.signalUpdateIOSVersion.emit(row, result.get("version"))
-            self.signalUpdateProgress.emit(row, self.tr("IOS Update Success"), Qt.green)
+            self.signalUpdateProgress.emit(row, self.tr("IOS Update Success") + self.formatTransfer(result), Qt.green)
 
         self.signalMarkDeviceAsIdle.emit(Device(row, address))
 
@@ -672,6 +959,7 @@ class RaspberryPiUpdateTools(QMainWindow):
         if not isinstance(result, dict):
             error_handle(result)
         else:
+            from framework.gui.dialog import JsonSettingDialog
             try:
                 app_state = AppState(**result)
                 app_state.size /= 1024 * 1024
@@ -680,7 +968,7 @@ class RaspberryPiUpdateTools(QMainWindow):
                 error_handle(e)
 
     def callbackFetchUpdateInfo(self, auth: dict, devices: List[Device],
-                                repo_release: dict, software_release: GogsSoftwareReleaseDesc):
+                                repo_release: dict, software_release: 'GogsSoftwareReleaseDesc'):
         title = self.tr("Online Update")
 
         # Single device ask user to confirm
@@ -696,54 +984,64 @@ class RaspberryPiUpdateTools(QMainWindow):
                 self.signalUpdateProgress.emit(devices[0].row, self.tr("No Need Update"), Qt.green)
                 return showMessageBox(self, MB_TYPE_INFO, self.tr("Current app is newest, do not need update"), title)
 
-        # Multi devices directly update
-        args = [(row, address, auth, repo_release, self.app_config.app_name) for row, address in devices]
-        self.createConcurrentOperateThread(
-            self.tr("Online Updating"), devices, OnlineUpdate, args,
-            lambda *results: self.callbackUpdate(self.tr("Online Update"), *results)
-        )
-
-    def threadScanRaspberryPi(self, timeout: float = 0.05):
-        for address in scan_server(timeout=timeout):
-            th = threading.Thread(target=self.threadFetchRaspberryPiInfo, kwargs=dict(address=address))
-            th.setDaemon(True)
-            th.start()
-
-    def threadFetchRaspberryPiInfo(self, address: str):
-        try:
-            query = Query(address)
-
-            ethernet, wireless = address, ''
-            _, revision, sn = query.get_hardware_info()
-            ifc_list = query.get_iface_list()
+        # Download release once to local cache, then push it to devices over lan
+        th = threading.Thread(target=self.threadFetchRelease,
+                              kwargs=dict(auth=auth, devices=devices,
+                                          repo_release=repo_release, software_release=software_release))
+        th.setDaemon(True)
+        th.start()
 
-            for interface in ifc_list:
-                if 'eth0' == interface:
-                    ethernet = query.get_ethernet_addr(interface)
-                else:
-                    wireless = query.get_ethernet_addr(interface)
+    def callbackLaunchOnlineUpdate(self, auth: dict, devices: List[Device],
+                                   repo_release: dict, package: Optional[SharedPackage]):
+        tag = self.tr("Online Update")
+        callback = lambda *results: self.callbackUpdate(tag, *results)
 
-            ethernet = ethernet or address
+        # Release cache not available, each device download release from update server itself
+        if package is None:
+            args = [(row, address, auth, repo_release, self.app_config.app_name) for row, address in devices]
+            self.createConcurrentOperateThread(self.tr("Online Updating"), devices, OnlineUpdate, args, callback)
+            return
 
-            try:
-                manager = AppManager(address)
-                app_state = manager.get_app_state(self.app_config.app_name)
-            except (RaspiException, AttributeError):
-                app_state = dict()
-
-            device = RaspberryPiInfo(revision=revision, sn=sn,
-                                     ethernet=ethernet, wireless=wireless,
-                                     ios_version=query.get_version().get("server"), app_state=app_state)
-            self.signalFoundDevice.emit(device)
-            self.signalLogging.emit(UiLogMessage.genDefaultDebugMessage(f'{address}: {device}'))
-        except Exception as e:
-            self.signalLogging.emit(UiLogMessage.genDefaultErrorMessage(f'Fetch {address!r} info error: {e}'))
-
-    def threadFetchUpdate(self, repo: str, auth: dict, manager: AppManager, devices: List[Device]):
+        delta_exe = self.app_config.exe_name if self.delta_update else ""
+        args = [(row, address, self.app_config.app_name, package, "", delta_exe, self.compress_transfer)
+                for row, address in devices]
+        self.createConcurrentOperateThread(self.tr("Online Updating"), devices, LocalUpdate, args, callback)
+
+    def callbackFetchRaspberryPiInfoError(self, address: str, error: Exception):
+        self.scan_failed.add(address)
+        self.signalLogging.emit(UiLogMessage.genDefaultErrorMessage(f'Fetch {address!r} info error: {error}'))
+
+    def callbackScanFinished(self, statistics: 'ScanStatistics'):
+        self.signalScanFinished.emit(statistics)
+        self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(self.tr("Scan finished") + f': {statistics}'))
+
+    @staticmethod
+    def generateIncrementalScanAddress(known: Set[str], fresh: Set[str], seen: Set[str]) -> Iterator[str]:
+        # New and expired devices answered scan
+        for address in scan_server(timeout=0.05):
+            seen.add(address)
+            if address not in fresh:
+                yield address
+
+        # Known devices not answered scan are probed directly, even not expired, broadcast may be lost
+        for address in known - seen:
+            yield address
+
+    async def fetchRaspberryPiInfo(self, address: str, run: 'BlockingRunner') -> RaspberryPiInfo:
+        from scanner import describe_device, format_timings
+        device, timings = await describe_device(address, self.getCurrentAppName(), run)
+        self.signalLogging.emit(UiLogMessage.genDefaultDebugMessage(f'{address}: {device}'))
+        self.signalLogging.emit(UiLogMessage.genDefaultDebugMessage(f'{address}: {format_timings(timings)}'))
+        return device
+
+    def threadFetchUpdate(self, repo: str, auth: dict, devices: List[Device]):
+        from framework.protocol.upgrade import GogsSoftwareReleaseDesc
         error = ""
 
         try:
-            repo_release, software_release = manager.fetch_update(auth, repo)
+            repo_release, software_release = connection_pool.call(
+                AppManager, devices[0].address, 'fetch_update', auth, repo, timeout=300
+            )
             software_release = GogsSoftwareReleaseDesc(**software_release)
 
             if not isinstance(software_release, GogsSoftwareReleaseDesc):
@@ -758,10 +1056,38 @@ class RaspberryPiUpdateTools(QMainWindow):
             if error:
                 self.ui_mail.send(MessageBoxMail(MB_TYPE_ERR, f"{error}", title=self.tr("Fetch update failed")))
 
+    def threadLoadPackage(self, path: str, loaded: Callable[[SharedPackage], None], exe_name: str):
+        try:
+            # Read and hash once, every device shares the same package
+            package = SharedPackage.open(path)
+            if exe_name:
+                package.member_md5(exe_name)
+
+            self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(self.tr("Load package") + f': {package}'))
+            self.ui_mail.send(CallbackFuncMail(loaded, args=(package,)))
+        except (OSError, ValueError) as e:
+            self.ui_mail.send(MessageBoxMail(MB_TYPE_ERR, f'{e}', title=self.tr("Load package failed")))
+
+    def threadFetchRelease(self, auth: dict, devices: List[Device],
+                           repo_release: dict, software_release: 'GogsSoftwareReleaseDesc'):
+        from release_cache import release_cache
+        try:
+            package = release_cache.fetch(software_release.url, software_release.version, software_release.md5, auth)
+            msg = self.tr("Release cached") + f': {software_release.version} {package}'
+            self.signalLogging.emit(UiLogMessage.genDefaultInfoMessage(msg))
+        except (OSError, ValueError, AttributeError) as e:
+            package = None
+            msg = self.tr("Release cache unavailable, devices will download release itself") + f': {e}'
+            self.signalLogging.emit(UiLogMessage.genDefaultErrorMessage(msg))
+
+        kwargs = dict(auth=auth, devices=devices, repo_release=repo_release, package=package)
+        self.ui_mail.send(CallbackFuncMail(self.callbackLaunchOnlineUpdate, kwargs=kwargs))
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     QTextCodec.setCodecForTr(QTextCodec.codecForName("UTF-8"))
-    windows = RaspberryPiUpdateTools()
+    with startup_profiler.measure('create window'):
+        windows = RaspberryPiUpdateTools()
     windows.show()
     sys.exit(app.exec_())
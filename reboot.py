@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import asyncio
+import threading
+import raspi_io
+import concurrent.futures
+from typing import Any, Callable
+from pool import connection_pool
+__all__ = ['RebootWatcher', 'reboot_watcher']
+
+
+class RebootWatcher(object):
+    def __init__(self, concurrency: int = 256, initial_interval: float = 1.0, max_interval: float = 10.0,
+                 probe_timeout: float = 3.0, down_timeout: float = 30.0, up_timeout: float = 180.0):
+        """Track rebooting devices on a single asyncio event loop thread, no worker is held while device reboots
+
+        A Query connection is opened before device goes down, it's broken as soon as io server is stopped,
+        however fast device comes back. Each device is probed with exponential backoff, first until that
+        connection is broken, then until its io server answers again
+
+        :param concurrency: max in-flight blocking probes, executor threads are only created when needed
+        :param initial_interval: first probe interval in seconds
+        :param max_interval: max probe interval in seconds
+        :param probe_timeout: raspi_io socket timeout of each probe
+        :param down_timeout: device io server not stopped within down_timeout is failed, reboot is not performed
+        :param up_timeout: device not back within up_timeout is failed
+        """
+        self._concurrency = concurrency
+        self._max_interval = max_interval
+        self._initial_interval = initial_interval
+        self._probe_timeout = probe_timeout
+        self._down_timeout = down_timeout
+        self._up_timeout = up_timeout
+
+        self._loop = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._concurrency)
+            thread = threading.Thread(target=self.threadWatch, name='RebootWatcher')
+            thread.setDaemon(True)
+            thread.start()
+
+        self._ready.wait()
+
+    def threadWatch(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def open(self, address: str) -> Any:
+        """Open probe session of a device, must be opened before reboot command is sent
+
+        :param address: device address
+        :return: probe session, raise if device is unreachable
+        """
+        return connection_pool.create(raspi_io.Query, address, timeout=self._probe_timeout)
+
+    def watch(self, address: str, session: Any, done: Callable[[bool], None], delay: float = 0.0):
+        """Start tracking a device which is going to reboot
+
+        :param address: device address
+        :param session: probe session opened by open() before reboot command is sent
+        :param done: called from watcher thread, done(True) when device is back online
+        :param delay: device reboot delay in seconds
+        :return:
+        """
+        self._start()
+        asyncio.run_coroutine_threadsafe(self._watch(address, session, done, delay), self._loop)
+
+    async def _probe(self, func: Callable, *args) -> bool:
+        # Probe failure is expected while device is rebooting
+        try:
+            return bool(await self._loop.run_in_executor(self._executor, func, *args))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _session_alive(session: Any) -> bool:
+        return bool(session.get_version())
+
+    def _server_ready(self, address: str) -> bool:
+        return bool(connection_pool.call(raspi_io.Query, address, 'get_version', timeout=self._probe_timeout))
+
+    async def _wait(self, probe: Callable[[Any], bool], target: Any, expect: bool, timeout: float) -> bool:
+        interval = self._initial_interval
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if await self._probe(probe, target) == expect:
+                return True
+
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 2, self._max_interval)
+
+        return False
+
+    async def _watch(self, address: str, session: Any, done: Callable[[bool], None], delay: float):
+        result = False
+        start = time.monotonic()
+
+        try:
+            await asyncio.sleep(delay)
+
+            # Only a broken session is the down edge, io server answering again may still be the old one
+            if await self._wait(self._session_alive, session, False, self._down_timeout):
+                # Connections will be broken after reboot
+                connection_pool.discard(address)
+                deadline = start + delay + self._up_timeout
+                result = await self._wait(self._server_ready, address, True, deadline - time.monotonic())
+        finally:
+            try:
+                done(result)
+            except Exception as e:
+                print(f'Reboot watcher callback error: {e}', file=sys.stderr)
+
+
+reboot_watcher = RebootWatcher()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import urllib.request
+from typing import Dict, Optional
+from payload import SharedPackage
+from configure import AppDataDir
+__all__ = ['ReleaseCache', 'release_cache']
+
+
+class ReleaseCache(object):
+    INDEX = 'index.json'
+
+    def __init__(self, directory: str, max_size: int = 2 * 1024 ** 3):
+        """Content addressed online update release cache, keyed by release version and md5, lru evicted by size
+
+        :param directory: cache directory
+        :param max_size: max total size of cached releases in bytes
+        """
+        self._max_size = max_size
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._fetching = dict()  # type: Dict[str, threading.Lock]
+        self._index = self._load_index()
+
+    @staticmethod
+    def _key(version, md5: str) -> str:
+        return f'{version}-{md5.lower()}'
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with open(os.path.join(self._directory, self.INDEX)) as fp:
+                index = json.load(fp)
+
+            return {k: v for k, v in index.items() if os.path.isfile(os.path.join(self._directory, v['file']))}
+        except (OSError, ValueError, KeyError, AttributeError):
+            return dict()
+
+    def _save_index(self):
+        path = os.path.join(self._directory, self.INDEX)
+        with open(path + '.tmp', 'w') as fp:
+            json.dump(self._index, fp, indent=4)
+
+        os.replace(path + '.tmp', path)
+
+    def get(self, version, md5: str) -> Optional[SharedPackage]:
+        """Get cached release
+
+        :param version: release version
+        :param md5: release package md5
+        :return: cached package or None
+        """
+        key = self._key(version, md5)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+
+            entry['last_used'] = time.time()
+            self._save_index()
+
+        try:
+            return SharedPackage.open(os.path.join(self._directory, entry['file']))
+        except (OSError, ValueError):
+            with self._lock:
+                self._index.pop(key, None)
+                self._save_index()
+            return None
+
+    def fetch(self, url: str, version, md5: str, auth: Optional[dict] = None, timeout: float = 60) -> SharedPackage:
+        """Get release from cache, download it once if it is not cached
+
+        :param url: release package download url
+        :param version: release version
+        :param md5: release package md5
+        :param auth: gogs server auth, username and password
+        :param timeout: download timeout
+        :return: cached package
+        """
+        key = self._key(version, md5)
+        with self._lock:
+            fetching = self._fetching.setdefault(key, threading.Lock())
+
+        # Same release only download once, others wait for it
+        with fetching:
+            package = self.get(version, md5)
+            if package is None:
+                package = self._download(key, url, version, md5, auth, timeout)
+
+        with self._lock:
+            self._fetching.pop(key, None)
+
+        return package
+
+    def _download(self, key: str, url: str, version, md5: str, auth: Optional[dict], timeout: float) -> SharedPackage:
+        request = urllib.request.Request(url)
+        if auth and auth.get('username'):
+            credential = f"{auth.get('username')}:{auth.get('password', '')}".encode()
+            request.add_header('Authorization', 'Basic ' + base64.b64encode(credential).decode())
+
+        os.makedirs(self._directory, exist_ok=True)
+        filename = f'{md5.lower()}.tar'
+        path = os.path.join(self._directory, filename)
+
+        digest = hashlib.md5()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response, open(path + '.tmp', 'wb') as fp:
+                for data in iter(lambda: response.read(256 * 1024), b''):
+                    digest.update(data)
+                    fp.write(data)
+
+            if digest.hexdigest() != md5.lower():
+                raise ValueError(f'release {version!r} md5 mismatch: {digest.hexdigest()} != {md5}')
+
+            os.replace(path + '.tmp', path)
+        except BaseException:
+            # Partial download never becomes a cached release
+            try:
+                os.remove(path + '.tmp')
+            except OSError:
+                pass
+
+            raise
+
+        with self._lock:
+            self._index[key] = dict(file=filename, size=os.path.getsize(path),
+                                    version=str(version), md5=md5.lower(), last_used=time.time())
+            self._evict(keep=key)
+            self._save_index()
+
+        return SharedPackage.open(path)
+
+    def _evict(self, keep: str):
+        total = sum([x['size'] for x in self._index.values()])
+        for key, entry in sorted(self._index.items(), key=lambda x: x[1]['last_used']):
+            if total <= self._max_size:
+                break
+
+            if key == keep:
+                continue
+
+            try:
+                os.remove(os.path.join(self._directory, entry['file']))
+            except OSError:
+                pass
+
+            total -= entry['size']
+            del self._index[key]
+
+
+release_cache = ReleaseCache(os.path.join(AppDataDir, 'releases'))
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import threading
+import collections
+import concurrent.futures
+from typing import Callable, Iterable, Optional, Any, Awaitable, Dict, Tuple
+from raspi_io import Query, AppManager, RaspiException
+from configure import RaspberryPiInfo
+from pool import connection_pool
+__all__ = ['FleetScanner', 'ScanStatistics', 'describe_device', 'format_timings']
+
+# Run a blocking function on scanner executor: await run(func, *args)
+BlockingRunner = Callable[..., Awaitable]
+
+
+async def describe_device(address: str, app_name: str, run: BlockingRunner,
+                          timeout: float = 3.0) -> Tuple[RaspberryPiInfo, Dict[str, float]]:
+    """Fetch all device info in one batch
+
+    raspi_io is a blocking request/response protocol, hardware/network/version queries share a pooled Query
+    connection while app state is fetched over the pooled AppManager connection at the same time, so a device
+    costs max(query lane, app manager lane) round trips instead of the sum of all of them
+
+    :param address: device address
+    :param app_name: app name to fetch app state, empty means do not fetch app state
+    :param run: blocking function runner
+    :param timeout: raspi_io socket timeout of each request, a dead address releases its executor thread after it
+    :return: device info and per step latency in milliseconds
+    """
+    timings = collections.OrderedDict()
+
+    def timed(step: str, func: Callable, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[step] = (time.perf_counter() - start) * 1000
+
+    def query_lane() -> Tuple[str, str, str, str, str]:
+        start = time.perf_counter()
+        with connection_pool.connection(Query, address, timeout=timeout) as query:
+            timings['connect'] = (time.perf_counter() - start) * 1000
+            ethernet, wireless = address, ''
+            _, revision, sn = timed('get_hardware_info', query.get_hardware_info)
+
+            for interface in timed('get_iface_list', query.get_iface_list):
+                if 'eth0' == interface:
+                    ethernet = timed(f'get_ethernet_addr({interface})', query.get_ethernet_addr, interface)
+                else:
+                    wireless = timed(f'get_ethernet_addr({interface})', query.get_ethernet_addr, interface)
+
+            ios_version = timed('get_version', query.get_version).get("server")
+            return revision, sn, ethernet or address, wireless, ios_version
+
+    def app_manager_lane() -> dict:
+        if not app_name:
+            return dict()
+
+        start = time.perf_counter()
+        try:
+            with connection_pool.connection(AppManager, address, timeout=timeout) as manager:
+                timings['connect_app_manager'] = (time.perf_counter() - start) * 1000
+                return timed('get_app_state', manager.get_app_state, app_name)
+        except RaspiException:
+            return dict()
+
+    start = time.perf_counter()
+    (revision, sn, ethernet, wireless, ios_version), app_state = await asyncio.gather(
+        run(query_lane), run(app_manager_lane)
+    )
+    timings['total'] = (time.perf_counter() - start) * 1000
+
+    device = RaspberryPiInfo(revision=revision, sn=sn,
+                             ethernet=ethernet, wireless=wireless, ios_version=ios_version, app_state=app_state)
+    return device, timings
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join([f'{step}: {ms:.1f}ms' for step, ms in timings.items()])
+
+
+class ScanStatistics(object):
+    __slots__ = ('found', 'failed', 'timeout', 'elapsed')
+
+    def __init__(self):
+        self.found = 0
+        self.failed = 0
+        self.timeout = False
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return f'found: {self.found}, failed: {self.failed}, timeout: {self.timeout}, elapsed: {self.elapsed:.2f}s'
+
+
+class FleetScanner(object):
+    def __init__(self, probe: Callable[[str, BlockingRunner], Awaitable], found: Callable[[Any], None],
+                 error: Optional[Callable[[str, Exception], None]] = None,
+                 finished: Optional[Callable[[ScanStatistics], None]] = None,
+                 concurrency: int = 32, scan_timeout: float = 120.0):
+        """Discovery engine, one asyncio event loop on a single worker thread
+
+        :param probe: coroutine function (address, run) -> device info(None means not a device),
+        blocking calls inside probe should be awaited via run(func, *args) and bounded by their own socket timeout,
+        an executor thread can't be cancelled from event loop
+        :param found: called from the worker thread for each device as soon as it is probed
+        :param error: called from the worker thread when a probe failed
+        :param finished: called from the worker thread when a scan is finished
+        :param concurrency: max in-flight probes
+        :param scan_timeout: max time for the whole scan
+        :return:
+        """
+        self._probe = probe
+        self._found = found
+        self._error = error
+        self._finished = finished
+        self._concurrency = max(1, concurrency)
+        self._scan_timeout = scan_timeout
+
+        self._loop = None
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def scan(self, addresses: Iterable[str]) -> bool:
+        """Start a scan in background
+
+        :param addresses: address iterable, may be a lazy generator like raspi_io.utility.scan_server
+        :return: false if previous scan is still running
+        """
+        if self.is_running():
+            return False
+
+        self._thread = threading.Thread(target=self.threadScan, args=(addresses,), name='FleetScanner')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return True
+
+    def threadScan(self, addresses: Iterable[str]):
+        statistics = ScanStatistics()
+        start = time.perf_counter()
+
+        # Blocking raspi_io calls run on a bounded executor, each probe may use two connections at same time
+        feeder = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._concurrency * 2)
+
+        try:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._scan(iter(addresses), feeder, executor, statistics))
+        finally:
+            self._loop.close()
+            self._loop = None
+            feeder.shutdown(wait=False)
+            executor.shutdown(wait=False)
+            statistics.elapsed = time.perf_counter() - start
+            if callable(self._finished):
+                self._finished(statistics)
+
+    async def _scan(self, addresses, feeder, executor, statistics: ScanStatistics):
+        # Bounded queue, producer is paused when all probes are busy
+        queue = asyncio.Queue(maxsize=self._concurrency * 2)
+        workers = [asyncio.ensure_future(self._worker(queue, executor, statistics))
+                   for _ in range(self._concurrency)]
+
+        async def produce_and_join():
+            await self._produce(addresses, queue, feeder)
+            await queue.join()
+
+        try:
+            await asyncio.wait_for(produce_and_join(), self._scan_timeout)
+        except asyncio.TimeoutError:
+            statistics.timeout = True
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _produce(self, addresses, queue: asyncio.Queue, feeder):
+        seen = set()
+        while True:
+            address = await self._loop.run_in_executor(feeder, next, addresses, None)
+            if address is None:
+                break
+
+            if address in seen:
+                continue
+
+            seen.add(address)
+            await queue.put(address)
+
+    async def _worker(self, queue: asyncio.Queue, executor, statistics: ScanStatistics):
+        while True:
+            address = await queue.get()
+            try:
+                def run(func: Callable, *args) -> Awaitable:
+                    return self._loop.run_in_executor(executor, func, *args)
+
+                device = await self._probe(address, run)
+
+                if device is not None:
+                    statistics.found += 1
+                    self._found(device)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                statistics.failed += 1
+                if callable(self._error):
+                    self._error(address, e)
+            finally:
+                queue.task_done()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import collections
+import concurrent.futures
+from typing import Dict, Sequence, Tuple, Any
+from operate import *
+__all__ = ['AdaptiveLimit', 'OperateScheduler', 'OperateStatistics']
+
+OperateStatistics = collections.namedtuple('OperateStatistics', ['limit', 'running', 'queued', 'throughput'])
+
+
+class AdaptiveLimit(object):
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 256,
+                 latency_tolerance: float = 2.0, throughput_drop: float = 0.5,
+                 backoff: float = 0.5, smoothing: float = 0.2):
+        """AIMD concurrency limit
+
+        Additive increase one slot per limit completions while operate succeed, latency stays close to
+        the best observed latency and completion throughput keeps up with the best observed throughput,
+        multiplicative decrease when operate failed, latency grown over latency_tolerance times of best
+        latency or throughput fallen throughput_drop below best throughput while limit is the bottleneck,
+        decrease at most once per latency period
+
+        :param initial: initial limit
+        :param minimum: min limit
+        :param maximum: max limit
+        :param latency_tolerance: latency / best latency ratio treat as congestion
+        :param throughput_drop: throughput drop ratio of best throughput treat as congestion
+        :param backoff: multiplicative decrease factor
+        :param smoothing: latency and throughput ewma factor
+        """
+        self._minimum = max(1, minimum)
+        self._maximum = max(self._minimum, maximum)
+        self._limit = float(min(max(initial, self._minimum), self._maximum))
+
+        self._backoff = backoff
+        self._smoothing = smoothing
+        self._throughput_drop = throughput_drop
+        self._latency_tolerance = latency_tolerance
+
+        self._latency = 0.0
+        self._best_latency = 0.0
+        self._last_decrease = 0.0
+
+        self._throughput = 0.0
+        self._best_throughput = 0.0
+        self._window_start = 0.0
+        self._completed = 0
+
+        self._queued = 0
+        self._running = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def statistics(self) -> OperateStatistics:
+        with self._condition:
+            return OperateStatistics(self.limit, self._running, self._queued, self._throughput)
+
+    def enqueue(self, count: int):
+        with self._condition:
+            self._queued += count
+
+    def acquire(self):
+        with self._condition:
+            while self._running >= self.limit:
+                self._condition.wait()
+
+            self._queued = max(0, self._queued - 1)
+            self._running += 1
+
+    def release(self, latency: float, success: bool):
+        with self._condition:
+            # App limited, limit is not the bottleneck, do not grow it
+            app_limited = self._running + self._queued <= self.limit
+            self._running -= 1
+            self._update(latency, success, app_limited)
+            self._condition.notify_all()
+
+    def _ewma(self, average: float, sample: float) -> float:
+        return sample if not average else average + self._smoothing * (sample - average)
+
+    def _update(self, latency: float, success: bool, app_limited: bool):
+        now = time.monotonic()
+        self._completed += 1
+        if not self._window_start:
+            self._window_start = now
+        elif now - self._window_start >= max(self._latency, 1.0):
+            # Completions per latency period, a single completion interval is too noisy
+            self._throughput = self._ewma(self._throughput, self._completed / (now - self._window_start))
+            self._completed, self._window_start = 0, now
+            # Draining queue lowers throughput too, only learn it while limit is the bottleneck
+            if not app_limited:
+                self._best_throughput = max(self._best_throughput, self._throughput)
+
+        if success:
+            self._latency = self._ewma(self._latency, latency)
+            self._best_latency = min(self._best_latency, latency) if self._best_latency else latency
+
+        starved = not app_limited and self._throughput < self._best_throughput * (1 - self._throughput_drop)
+        congested = success and (self._latency > self._best_latency * self._latency_tolerance or starved)
+        if not success or congested:
+            # Decrease once per latency period, a burst of failures only counts once
+            if now - self._last_decrease > max(self._latency, 1.0):
+                self._limit = max(self._minimum, self._limit * self._backoff)
+                self._last_decrease = now
+                # Best latency and throughput may be out of date after decrease, let them recover
+                self._best_latency = self._latency if congested else self._best_latency
+                self._best_throughput = self._throughput if congested else self._best_throughput
+        elif not app_limited:
+            self._limit = min(self._maximum, self._limit + 1.0 / self._limit)
+
+
+class OperateScheduler(object):
+    # Operate class: (initial, minimum, maximum) concurrency
+    DEFAULT_LIMITS = {
+        LocalUpdate: (4, 1, 32),
+        OnlineUpdate: (8, 1, 64),
+        InstallUserApp: (4, 1, 32),
+        UninstallUserApp: (32, 4, 256),
+        Reboot: (64, 8, 512),
+        GetAppState: (64, 8, 512),
+        JoinWirelessNetwork: (32, 4, 256),
+        LeaveWirelessNetwork: (32, 4, 256),
+    }
+
+    def __init__(self, max_workers: int = 512):
+        """Run operates with per operate class adaptive concurrency limit
+
+        :param max_workers: max worker threads of all operates
+        """
+        self._lock = threading.Lock()
+        self._limits = dict()  # type: Dict[type, AdaptiveLimit]
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def limit(self, operate_cls) -> AdaptiveLimit:
+        with self._lock:
+            if operate_cls not in self._limits:
+                initial, minimum, maximum = self.DEFAULT_LIMITS.get(operate_cls, (32, 1, 256))
+                self._limits[operate_cls] = AdaptiveLimit(initial, minimum, maximum)
+
+            return self._limits[operate_cls]
+
+    def statistics(self) -> Dict[str, OperateStatistics]:
+        with self._lock:
+            limits = list(self._limits.items())
+
+        return {cls.__name__: limit.statistics() for cls, limit in limits}
+
+    def submit(self, operate: RaspiOperate, operate_args: Sequence[Tuple[Any, ...]]):
+        """Run operate for each args, return immediately
+
+        :param operate: operate instance
+        :param operate_args: operate args list, each item is a tuple of operate run args
+        :return:
+        """
+        limit = self.limit(operate.__class__)
+        limit.enqueue(len(operate_args))
+        th = threading.Thread(target=self.threadDispatch, args=(operate, limit, list(operate_args)))
+        th.setDaemon(True)
+        th.start()
+
+    def threadDispatch(self, operate: RaspiOperate, limit: AdaptiveLimit, operate_args: list):
+        for args in operate_args:
+            limit.acquire()
+            self._executor.submit(self._run, operate, limit, args)
+
+    @staticmethod
+    def _run(operate: RaspiOperate, limit: AdaptiveLimit, args: Tuple[Any, ...]):
+        success = False
+        start = time.perf_counter()
+
+        try:
+            result = operate.run(*args)
+            # RaspiOperate.run returns error message string when operate raised
+            success = not isinstance(result, str) and result is not False
+        finally:
+            limit.release(time.perf_counter() - start, success)
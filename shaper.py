@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import collections
+from typing import Optional
+__all__ = ['BandwidthShaper', 'bandwidth_shaper']
+
+
+class BandwidthShaper(object):
+    def __init__(self, rate: float = 0.0, burst: float = 4 * 1024 * 1024):
+        """Token bucket shared by every bulk transfer worker, only limits average rate of all transfers
+
+        raspi_io sends a package by path in one request and can't be streamed, so bytes on the wire are not paced.
+        A transfer takes all its bytes when it starts and runs at full link speed, the bucket goes into debt and
+        following transfers wait until the debt is repaid. Waiting transfers are granted device by device in
+        round robin. Control requests(queries, app state, reboot probes) are not shaped, they may still queue
+        behind a transfer in flight
+
+        :param rate: total average rate in bytes/s, 0 means unlimited
+        :param burst: bucket size in bytes
+        """
+        self._burst = burst
+
+        self._rate = 0.0
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+        self._waiting = 0
+        self._ticket = 0
+        self._queues = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self.rate = rate
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: float):
+        with self._condition:
+            self._refill()
+            self._rate = max(0.0, rate)
+            self._condition.notify_all()
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _is_next(self, address: str, ticket: int) -> bool:
+        # Device of round robin head, and its oldest ticket
+        head = next(iter(self._queues))
+        return head == address and self._queues[head][0] == ticket
+
+    def acquire(self, address: str, size: int, timeout: Optional[float] = None) -> float:
+        """Take size bytes before a bulk transfer start
+
+        :param address: transfer device address
+        :param size: transfer bytes
+        :param timeout: max wait seconds, None wait forever
+        :return: wait seconds
+        """
+        start = time.monotonic()
+        with self._condition:
+            if self._rate <= 0:
+                return 0.0
+
+            self._ticket += 1
+            ticket = self._ticket
+            self._queues.setdefault(address, collections.deque()).append(ticket)
+            self._waiting += 1
+
+            try:
+                while True:
+                    self._refill()
+                    if self._rate <= 0 or (self._tokens >= 0 and self._is_next(address, ticket)):
+                        break
+
+                    # Wake up when debt is repaid or another transfer is granted
+                    delay = -self._tokens / self._rate if self._tokens < 0 else None
+                    if timeout is not None:
+                        remain = timeout - (time.monotonic() - start)
+                        if remain <= 0:
+                            raise TimeoutError(f'Wait {size} bytes bandwidth timeout')
+
+                        delay = remain if delay is None else min(delay, remain)
+
+                    self._condition.wait(delay)
+
+                self._tokens -= size
+            finally:
+                self._waiting -= 1
+                queue = self._queues[address]
+                queue.remove(ticket)
+                del self._queues[address]
+                if queue:
+                    # Device goes to round robin tail
+                    self._queues[address] = queue
+
+                self._condition.notify_all()
+
+        return time.monotonic() - start
+
+
+bandwidth_shaper = BandwidthShaper()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import contextlib
+import collections
+__all__ = ['StartupProfiler', 'startup_profiler']
+
+
+class StartupProfiler(object):
+    def __init__(self):
+        """Measure startup stages(import groups, window construction, first event loop tick)"""
+        self._start = time.perf_counter()
+        self._stages = collections.OrderedDict()
+        self._modules = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        """Measure a startup stage, imported module number of the stage is recorded too"""
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages[name] = (time.perf_counter() - start) * 1000
+            self._modules[name] = len(sys.modules) - modules
+
+    def mark(self, name: str):
+        """Record elapsed time since profiler created"""
+        self._stages[name] = (time.perf_counter() - self._start) * 1000
+
+    def report(self) -> str:
+        return ", ".join(
+            f'{name}: {elapsed:.1f}ms' + (f'({self._modules[name]} modules)' if name in self._modules else '')
+            for name, elapsed in self._stages.items()
+        )
+
+    def save(self, path: str, version: str = ''):
+        """Append this startup as a json line, compare lines to find startup regressions"""
+        record = dict(time=time.strftime("%Y-%m-%d %H:%M:%S"), version=version, modules=len(sys.modules),
+                      stages={k: round(v, 1) for k, v in self._stages.items()})
+
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as fp:
+                fp.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f'Save startup report {path!r} error: {e}', file=sys.stderr)
+
+
+startup_profiler = StartupProfiler()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import collections
+from PySide.QtCore import QObject, QTimer
+from typing import Any, Callable, Hashable, Optional
+__all__ = ['UiUpdateBus', 'CoalescedSignal']
+
+
+class CoalescedSignal(object):
+    def __init__(self, bus: 'UiUpdateBus', handler: Callable, key: Optional[Callable[..., Hashable]] = None):
+        """Signal like object, emit from any thread, handler is called on gui thread in next bus flush
+
+        :param bus: update bus
+        :param handler: handler run on gui thread
+        :param key: coalesce key of emit args, same key only the latest emit will be delivered,
+        None means every emit will be delivered in order
+        """
+        self._bus = bus
+        self._key = key
+        self._handler = handler
+
+    def emit(self, *args):
+        if self._key is None:
+            self._bus.append(self._handler, *args)
+        else:
+            self._bus.post((id(self), self._key(*args)), self._handler, *args)
+
+
+class UiUpdateBus(QObject):
+    def __init__(self, interval: int = 50, parent: Optional[QObject] = None):
+        """Collect gui updates from worker threads and apply them in batch every interval ms
+
+        :param interval: flush interval in ms
+        :param parent: parent
+        """
+        super(UiUpdateBus, self).__init__(parent)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # Ordered and keyed updates share one queue, updates of same row are applied in the order they are posted
+        self._pending = collections.OrderedDict()
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(interval)
+
+    def signal(self, handler: Callable, key: Optional[Callable[..., Hashable]] = None) -> CoalescedSignal:
+        return CoalescedSignal(self, handler, key)
+
+    def post(self, key: Hashable, handler: Callable, *args: Any):
+        """Latest wins update, previous not yet delivered update of same key is dropped, new one is queued at tail"""
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (handler, args)
+
+    def append(self, handler: Callable, *args: Any):
+        """Ordered update, every update will be delivered"""
+        with self._lock:
+            self._sequence += 1
+            self._pending[(None, self._sequence)] = (handler, args)
+
+    def flush(self):
+        """Apply all pending updates, must be called on gui thread"""
+        with self._lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, collections.OrderedDict()
+
+        # One failed update must not drop the rest of batch
+        for handler, args in pending.values():
+            try:
+                handler(*args)
+            except Exception as e:
+                print(f'Ui update {getattr(handler, "__name__", handler)!r} error: {e}', file=sys.stderr)